@@ -4,20 +4,35 @@ import json
 import re
 import logging
 import uuid
+import hashlib
 import time
 import requests
-from flask import Flask, jsonify, request, send_file, render_template, Response, redirect
+import httpx
+from requests.adapters import HTTPAdapter
+from flask import Flask, jsonify, request, send_file, render_template, Response, redirect, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from functools import wraps, lru_cache
+from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 from supabase import create_client
 import datetime
 from logging.handlers import RotatingFileHandler
 from flask_cors import CORS
 from PIL import Image
-from io import BytesIO
-import tempfile
 import mimetypes
+from email.utils import formatdate
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+import orjson
+import redis
+import jwt
+from get_top_tags import get_top_tags
 
 # Load environment variables only in development
 if os.path.exists('.env'):
@@ -28,6 +43,25 @@ app = Flask(__name__,
     template_folder='../frontend/templates'
 )
 
+# Let a fronting web server deliver files from send_file (cached thumbnails) via
+# X-Sendfile. Without one, gunicorn's wsgi.file_wrapper already uses sendfile(2).
+app.use_x_sendfile = os.getenv('USE_X_SENDFILE') == 'True'
+
+# Redirect /api/stream to presigned B2 URLs instead of proxying the audio. Only enable
+# once the bucket has the CORS rule from setup_connections.txt, or playback breaks
+STREAM_REDIRECT = os.getenv('STREAM_REDIRECT') == 'True'
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, so every jsonify() call serializes in C"""
+    def dumps(self, obj, **kwargs):
+        # Types orjson doesn't handle natively (Decimal, ...) go through Flask's default
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 # Ensure static directory exists
 os.makedirs(os.path.join(app.root_path, 'static'), exist_ok=True)
 
@@ -45,6 +79,10 @@ if not os.path.exists(placeholder_path):
             f.write(bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082'))
             print(f"Created fallback placeholder image at {placeholder_path}")
 
+# Keep the placeholder in memory, it's served for every song without a thumbnail
+with open(placeholder_path, 'rb') as f:
+    _PLACEHOLDER_BYTES = f.read()
+
 # Configure CORS based on environment
 if os.getenv('RAILWAY_ENVIRONMENT') == 'True':
     # In production, only allow requests from your Railway domain
@@ -72,29 +110,8 @@ frontend_logger = logging.getLogger('frontend')
 frontend_logger.setLevel(logging.DEBUG)
 frontend_logger.propagate = False  # Don't send logs to parent logger
 
-# Create temp directory for converted images
-TEMP_DIR = os.path.join(tempfile.gettempdir(), 'music_player_temp')
-os.makedirs(TEMP_DIR, exist_ok=True)
-
-def convert_webp_to_png(webp_data):
-    try:
-        # Open WebP image from bytes
-        img = Image.open(BytesIO(webp_data))
-        
-        # Convert to RGB if necessary
-        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-            img = img.convert('RGBA')
-        else:
-            img = img.convert('RGB')
-            
-        # Save as PNG to BytesIO
-        output = BytesIO()
-        img.save(output, format='PNG')
-        output.seek(0)
-        return output
-    except Exception as e:
-        logger.error(f"Error converting WebP to PNG: {str(e)}")
-        return None
+# Executor for fire-and-forget work that shouldn't hold up a request
+background_executor = ThreadPoolExecutor(max_workers=2)
 
 # Validate B2 credentials
 B2_KEY_ID = os.getenv('B2_KEY_ID')
@@ -114,11 +131,25 @@ B2_ENDPOINT = 'https://s3.eu-central-003.backblazeb2.com'  # Use EU Central endp
 logger.info(f"Using B2 endpoint: {B2_ENDPOINT}")
 logger.info(f"Using key ID: {s3_key_id[:10]}...")  # Log first part of key ID
 
-# Initialize Supabase client
+# Initialize Supabase client once per worker so every request reuses its connection pool.
+# Prefer the service-role key: handlers verify the user themselves and scope every
+# query by user_id, so there is no need for per-request RLS auth on the client.
 supabase = create_client(
     os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
+    os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('SUPABASE_KEY')
+)
+
+# httpx keeps only a handful of idle connections by default; with threaded workers
+# and concurrent Supabase calls that means new TLS handshakes. Swap in a PostgREST
+# session with a larger keep-alive pool (same base URL, headers and timeout).
+_default_postgrest_session = supabase.postgrest.session
+supabase.postgrest.session = httpx.Client(
+    base_url=_default_postgrest_session.base_url,
+    headers=_default_postgrest_session.headers,
+    timeout=_default_postgrest_session.timeout,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60)
 )
+_default_postgrest_session.close()
 
 # Initialize S3 client for B2
 try:
@@ -150,6 +181,316 @@ except Exception as e:
     logger.error(f"Failed to initialize S3 client: {str(e)}")
     raise
 
+# Columns the frontend renders for song lists, and for a single song's details.
+# Storage paths and B2 URLs stay server-side; streaming only needs the storage path.
+SONG_LIST_COLUMNS = 'id,title,artist,album,duration,updated_at,has_thumbnail'
+SONG_DETAIL_COLUMNS = 'id,title,artist,album,duration,release_date,view_count,like_count,description,source_url,youtube_url,created_at,updated_at'
+SONG_STREAM_COLUMNS = 'id,title,storage_path'
+
+# Short-lived caches for Supabase reads that clients repeat while scrolling and playing.
+# TTLCache isn't thread-safe, so all access goes through _cache_lock.
+_cache_lock = threading.Lock()
+_songs_cache = TTLCache(maxsize=512, ttl=60)  # serialized /api/songs pages
+_song_meta_cache = TTLCache(maxsize=10000, ttl=300)  # stream lookups (SONG_STREAM_COLUMNS) by ID
+_liked_songs_cache = TTLCache(maxsize=5000, ttl=300)  # serialized /api/liked-songs by "liked:<user ID>:<version>"
+_top_tags_cache = TTLCache(maxsize=32, ttl=300)  # serialized top tags by "top_tags:<limit>"
+
+# Optional Redis shared by all gunicorn workers, so a like on one worker invalidates
+# the cached liked songs for every worker. Without REDIS_URL the caches above are
+# used per process.
+_redis = redis.Redis.from_url(os.getenv('REDIS_URL'), socket_timeout=0.5) if os.getenv('REDIS_URL') else None
+
+def _shared_cache_get(cache, key):
+    """Read bytes from Redis when configured, otherwise from the process-local cache"""
+    if _redis is not None:
+        try:
+            return _redis.get(key)
+        except redis.RedisError as e:
+            logger.warning(f"Redis get failed for {key}: {str(e)}")
+            return None
+    with _cache_lock:
+        return cache.get(key)
+
+def _shared_cache_set(cache, key, value):
+    """Store bytes in Redis (with the local cache's TTL) or in the process-local cache"""
+    if _redis is not None:
+        try:
+            _redis.set(key, value, ex=int(cache.ttl))
+        except redis.RedisError as e:
+            logger.warning(f"Redis set failed for {key}: {str(e)}")
+        return
+    with _cache_lock:
+        cache[key] = value
+
+# Invalidation epoch of the song caches, bumped in Redis by /api/cache/invalidate.
+# Each worker clears its own _songs_cache and _song_meta_cache when it sees a new one.
+_cache_epoch = None
+
+def _sync_cache_epoch():
+    """Drop this worker's song caches if they were invalidated through another worker"""
+    global _cache_epoch
+    if _redis is None:
+        return
+    try:
+        epoch = _redis.get('cache_epoch')
+    except redis.RedisError as e:
+        logger.warning(f"Redis get failed for cache_epoch: {str(e)}")
+        return
+    with _cache_lock:
+        if epoch != _cache_epoch:
+            _song_meta_cache.clear()
+            _songs_cache.clear()
+            _cache_epoch = epoch
+
+# Liked songs change on every like, so a process-local copy is only correct when this
+# is the only worker. With several workers and no Redis the cache is disabled.
+LIKED_SONGS_CACHE_ENABLED = _redis is not None or os.getenv('WEB_CONCURRENCY') == '1'
+
+# Per-user invalidation counters, part of the liked songs cache key so a stream that
+# started before a like stores its body under a key that is never read again
+_liked_songs_versions = {}
+_liked_songs_version_counter = itertools.count(1)
+
+def _liked_songs_version(user_id):
+    """Current liked songs version of a user, or None if it can't be read"""
+    if _redis is not None:
+        try:
+            return (_redis.get(f"liked_version:{user_id}") or b'0').decode()
+        except redis.RedisError as e:
+            logger.warning(f"Redis get failed for liked_version:{user_id}: {str(e)}")
+            return None
+    with _cache_lock:
+        return str(_liked_songs_versions.get(user_id, 0))
+
+def _bump_liked_songs_version(user_id):
+    """Move a user's liked songs to a new version, orphaning the cached body"""
+    if _redis is not None:
+        try:
+            with _redis.pipeline() as pipe:
+                pipe.incr(f"liked_version:{user_id}")
+                pipe.expire(f"liked_version:{user_id}", 86400)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Redis incr failed for liked_version:{user_id}: {str(e)}")
+        return
+    with _cache_lock:
+        _liked_songs_versions[user_id] = next(_liked_songs_version_counter)
+
+# Shared HTTP session so B2 downloads reuse keep-alive connections instead of
+# doing a new TLS handshake per request
+_b2_session = requests.Session()
+_b2_session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=64))
+
+# Presigned URLs are valid for an hour; reuse them for half of that
+_presign_cache = TTLCache(maxsize=4096, ttl=1800)
+
+# Thumbnail URLs are signed for the S3 maximum of 7 days so a redirect the browser
+# caches for a day still points at a valid URL
+THUMBNAIL_URL_EXPIRY = 7 * 24 * 3600
+
+def _presign(key, expires_in=3600):
+    """Return a presigned GET URL for a B2 object, reusing recently signed URLs"""
+    cache_key = (key, expires_in)
+    with _cache_lock:
+        url = _presign_cache.get(cache_key)
+    if url is None:
+        url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': B2_BUCKET_NAME, 'Key': key},
+            ExpiresIn=expires_in  # 1 hour unless asked otherwise
+        )
+        with _cache_lock:
+            _presign_cache[cache_key] = url
+    return url
+
+@lru_cache(maxsize=4096)
+def _thumb_stem(song_id):
+    """Format a song ID the way B2 names thumbnails (exactly 6 digits with leading zeros)"""
+    if song_id.isdigit():
+        return f"{int(song_id):06d}"
+    return song_id.lstrip('0').zfill(6)
+
+@lru_cache(maxsize=4096)
+def _thumb_key(song_id):
+    """B2 object key of a song's thumbnail - must be exactly thumbnails/XXXXXX.png"""
+    return f"thumbnails/{_thumb_stem(song_id)}.png"
+
+# 6-digit IDs of the thumbnails in B2, from a ListObjectsV2 sweep refreshed every 10 minutes
+_thumbnail_index = None
+_thumbnail_index_time = 0
+_thumbnail_index_lock = threading.Lock()
+THUMBNAIL_INDEX_TTL = 600
+_thumb_hit = TTLCache(maxsize=100000, ttl=86400)
+_thumb_miss = TTLCache(maxsize=100000, ttl=300)
+
+def _refresh_thumbnail_index(locked=False):
+    """Rebuild the thumbnail index with a ListObjectsV2 sweep of the bucket"""
+    global _thumbnail_index, _thumbnail_index_time
+    # Only one thread rebuilds the index, the others keep using the previous one.
+    # locked=True means the caller already holds the lock and hands it over.
+    if not locked and not _thumbnail_index_lock.acquire(blocking=False):
+        return
+    try:
+        thumbnail_ids = set()
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=B2_BUCKET_NAME, Prefix='thumbnails/'):
+            for obj in page.get('Contents', []):
+                # thumbnails/000500.png -> 000500
+                thumbnail_ids.add(obj['Key'][len('thumbnails/'):].rsplit('.', 1)[0])
+        _thumbnail_index = thumbnail_ids
+        logger.info(f"Indexed {len(thumbnail_ids)} thumbnails in B2")
+    except Exception as e:
+        logger.warning(f"Failed to index thumbnails: {str(e)}")
+    finally:
+        _thumbnail_index_time = time.time()
+        _thumbnail_index_lock.release()
+
+def _thumbnail_exists(formatted_id):
+    """Check whether B2 has a thumbnail, using the bucket index and cached HEAD results"""
+    if time.time() - _thumbnail_index_time > THUMBNAIL_INDEX_TTL and _thumbnail_index_lock.acquire(blocking=False):
+        # Sweep the bucket in the background and keep answering from the previous index
+        try:
+            background_executor.submit(_refresh_thumbnail_index, locked=True)
+        except RuntimeError:
+            _thumbnail_index_lock.release()
+    if _thumbnail_index is not None and formatted_id in _thumbnail_index:
+        return True
+    
+    # Not in the index (yet) - check B2 directly. Misses are only remembered for
+    # 5 minutes so newly uploaded thumbnails show up quickly.
+    with _cache_lock:
+        if formatted_id in _thumb_hit:
+            return True
+        if formatted_id in _thumb_miss:
+            return False
+    try:
+        s3_client.head_object(Bucket=B2_BUCKET_NAME, Key=f"thumbnails/{formatted_id}.png")
+        exists = True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            return True  # Don't cache errors, let the browser try B2
+        exists = False
+    except Exception:
+        return True
+    with _cache_lock:
+        (_thumb_hit if exists else _thumb_miss)[formatted_id] = True
+    return exists
+
+# Disk cache for proxied thumbnails. Files are tracked in LRU order in memory so
+# eviction never has to list and stat the whole directory.
+THUMBNAIL_CACHE_DIR = os.path.join(app.root_path, 'thumbnails_cache')
+THUMBNAIL_CACHE_SIZE = 1000  # Limit to 1000 cached thumbnails
+os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+_thumb_lru = OrderedDict()
+for _mtime, _name in sorted((entry.stat().st_mtime, entry.name) for entry in os.scandir(THUMBNAIL_CACHE_DIR) if entry.is_file()):
+    _thumb_lru[_name] = _mtime
+
+WARM_SONG_COUNT = 30
+
+def _warm_caches():
+    """Fill the thumbnail index and the newest songs' stream lookups before the first request"""
+    _refresh_thumbnail_index()
+    _sync_cache_epoch()
+    try:
+        response = supabase.table('songs').select(SONG_STREAM_COLUMNS).order('updated_at', desc=True).limit(WARM_SONG_COUNT).execute()
+        for song in response.data:
+            with _cache_lock:
+                _song_meta_cache[song['id']] = song
+            if song.get('storage_path'):
+                _presign(song['storage_path'])
+        logger.info(f"Warmed caches for {len(response.data)} songs")
+    except Exception as e:
+        logger.warning(f"Failed to warm song caches: {str(e)}")
+
+# Warm up off the request path so the first requests after a deploy aren't slow
+threading.Thread(target=_warm_caches, daemon=True).start()
+
+def _json(data, status=200):
+    """Serialize a JSON response with orjson, which is much faster than jsonify"""
+    return Response(orjson.dumps(data), status=status, mimetype='application/json')
+
+def _cacheable_json(data, cache_control):
+    """JSON response with an ETag and Cache-Control, answering If-None-Match with 304"""
+    body = orjson.dumps(data)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(hashlib.blake2b(body, digest_size=8).hexdigest())
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+class AuthError(Exception):
+    """Raised when a request lacks a valid authentication token"""
+    def __init__(self, message, status_code=401):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+# Supabase signs access tokens with the project's JWT secret; when it's configured
+# tokens are verified locally instead of with a round-trip to Supabase Auth
+SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET')
+
+# User IDs of recently verified tokens, keyed by a hash of the token
+_auth_cache = TTLCache(maxsize=10000, ttl=300)
+
+def _authenticate(token):
+    """Return the user ID for an access token, raising if the token is invalid or expired"""
+    token_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _cache_lock:
+        cached = _auth_cache.get(token_key)
+    # Cached entries are only valid until the token itself expires
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+    
+    if SUPABASE_JWT_SECRET:
+        # Checks the signature and exp claim
+        payload = jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=['HS256'], audience='authenticated',
+                             options={'require': ['exp', 'sub']})
+        user_id = payload['sub']
+    else:
+        user_id = supabase.auth.get_user(token).user.id
+        payload = jwt.decode(token, options={'verify_signature': False})
+    
+    with _cache_lock:
+        _auth_cache[token_key] = (user_id, payload.get('exp', 0))
+    return user_id
+
+def require_auth(f):
+    """
+    Decorator for routes that require authentication.
+    Verifies the Bearer token and stores the user ID in g.user_id.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # Slice off the 'Bearer ' prefix instead of splitting the header into a list
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[7:] if auth_header.startswith('Bearer ') else None
+        if not token:
+            logger.error("Missing or invalid Authorization header")
+            raise AuthError('Authentication required')
+        
+        # Verify the token locally or with Supabase
+        try:
+            g.user_id = _authenticate(token)
+            logger.info(f"User authenticated: {g.user_id}")
+        except Exception as e:
+            logger.error(f"Failed to authenticate user: {str(e)}")
+            raise AuthError('Invalid authentication token')
+        
+        return f(*args, **kwargs)
+    
+    return decorated
+
+@app.errorhandler(AuthError)
+def handle_auth_error(e):
+    return jsonify({'success': False, 'error': e.message}), e.status_code
+
+@app.errorhandler(Exception)
+def handle_unexpected_error(e):
+    # Let Flask render regular HTTP errors (404, 405, ...) as usual
+    if isinstance(e, HTTPException):
+        return e
+    logger.exception(f"Unhandled error in {request.endpoint}: {str(e)}")
+    return jsonify({'success': False, 'error': str(e)}), 500
+
 # Context processor to inject environment variables into templates
 @app.context_processor
 def inject_env_variables():
@@ -179,247 +520,58 @@ def get_songs():
             random_mode = request.args.get('random', 'false').lower() == 'true'
             thumbnails_only = request.args.get('thumbnails_only', 'true').lower() == 'true'
             tag = request.args.get('tag', '')  # Get tag parameter
-            logger.info(f"Fetching songs with limit {page_size}, offset {offset}, random={random_mode}, thumbnails_only={thumbnails_only}, tag={tag}")
+            logger.info("Fetching songs with limit %s, offset %s, random=%s, thumbnails_only=%s, tag=%s", page_size, offset, random_mode, thumbnails_only, tag)
         except ValueError:
             logger.error("Invalid pagination parameters")
-            return jsonify({'error': 'Invalid pagination parameters'}), 400
-
-        # Cache of thumbnail existence to avoid repeated checks
-        if not hasattr(app, 'thumbnail_existence_cache'):
-            app.thumbnail_existence_cache = {}
-
-        # Refresh cache every hour
-        if hasattr(app, 'thumbnail_cache_timestamp'):
-            cache_age = time.time() - app.thumbnail_cache_timestamp
-            if cache_age > 3600:  # 1 hour
-                logger.info("Refreshing thumbnail existence cache")
-                app.thumbnail_existence_cache = {}
-                app.thumbnail_cache_timestamp = time.time()
-        else:
-            app.thumbnail_cache_timestamp = time.time()
+            return _json({'error': 'Invalid pagination parameters'}, 400)
+
+        # Serve repeated (non-random) pages from the cache
+        cache_key = (offset, page_size, random_mode, thumbnails_only, tag)
+        if not random_mode:
+            _sync_cache_epoch()
+            with _cache_lock:
+                cached_result = _songs_cache.get(cache_key)
+            if cached_result is not None:
+                return Response(cached_result, mimetype='application/json')
 
-        # If tag filtering is enabled, we need to use a different query
+        # One RPC does the filtering, ordering, pagination and total count inside
+        # Postgres (see songs_page and songs_by_tag in supabase/tables.sql)
+        params = {
+            'p_limit': page_size,
+            'p_offset': offset,
+            'p_random': random_mode,
+            'p_thumbs': thumbnails_only
+        }
         if tag:
-            logger.info(f"Filtering songs by tag: {tag}")
-            
-            # Get tag ID first
-            tag_response = supabase.table('tags').select('id').eq('name', tag).execute()
-            
-            if not tag_response.data:
-                logger.warning(f"Tag '{tag}' not found")
-                return jsonify({
-                    'songs': [],
-                    'total': 0,
-                    'offset': offset,
-                    'limit': page_size,
-                    'has_more': False,
-                    'random': random_mode,
-                    'thumbnails_only': thumbnails_only,
-                    'tag': tag
-                })
-            
-            tag_id = tag_response.data[0]['id']
-            
-            # Get songs with this tag using a join query
-            # First get song IDs that have this tag
-            song_ids_query = supabase.from_('song_tags') \
-                .select('song_id') \
-                .eq('tag_id', tag_id)
-                
-            if random_mode:
-                # Add randomization if needed
-                song_ids_query = song_ids_query.order('random()', desc=False)
-                
-            # Apply pagination
-            song_ids_query = song_ids_query.range(offset, offset + page_size * 3 - 1)
-            song_ids_response = song_ids_query.execute()
-            
-            if not song_ids_response.data:
-                logger.warning(f"No songs found with tag '{tag}'")
-                return jsonify({
-                    'songs': [],
-                    'total': 0,
-                    'offset': offset,
-                    'limit': page_size,
-                    'has_more': False,
-                    'random': random_mode,
-                    'thumbnails_only': thumbnails_only,
-                    'tag': tag
-                })
-                
-            # Extract song IDs
-            song_ids = [item['song_id'] for item in song_ids_response.data]
-            
-            # Get song details for these IDs
-            songs_query = supabase.table('songs').select('*').in_('id', song_ids)
-            
-            if not random_mode:
-                # Apply normal ordering if not in random mode
-                songs_query = songs_query.order('updated_at', desc=True)
-                
-            songs_response = songs_query.execute()
-            songs = songs_response.data
-            
-            # Get the total count of songs with this tag for pagination
-            count_response = supabase.from_('song_tags') \
-                .select('song_id', count='exact') \
-                .eq('tag_id', tag_id) \
-                .execute()
-            total_count = count_response.count if hasattr(count_response, 'count') else 0
-            
-            logger.info(f"Found {len(songs)} songs with tag '{tag}' (total: {total_count})")
+            logger.info("Filtering songs by tag: %s", tag)
+            rpc_response = supabase.rpc('songs_by_tag', {'tag_name': tag, **params}).execute()
         else:
-            # First get total count without thumbnail filtering
-            count_response = supabase.table('songs').select('*', count='exact').execute()
-            total_count = count_response.count if hasattr(count_response, 'count') else 0
-            logger.info(f"Total songs in database: {total_count}")
-
-            # Build the query
-            query = supabase.table('songs').select('*')
-            
-            # Apply ordering - random or by most recent
-            if random_mode:
-                # PostgreSQL random() function for true randomization
-                query = query.order('random()', desc=False)
-            else:
-                # Default to showing newest songs first
-                query = query.order('updated_at', desc=True)
-                
-            # Apply pagination - get more than needed to account for thumbnail filtering
-            expanded_limit = page_size * 3 if thumbnails_only else page_size
-            query = query.range(offset, offset + expanded_limit - 1)
-            
-            # Execute query
-            response = query.execute()
-            
-            songs = response.data
-            logger.info(f"Retrieved {len(songs)} songs before thumbnail filtering")
+            rpc_response = supabase.rpc('songs_page', params).execute()
         
-        # If thumbnails_only is true, filter songs to only those with thumbnails
-        if thumbnails_only:
-            filtered_songs = []
-            filtered_count = 0
-            
-            for song in songs:
-                # Check if we need more songs for this page
-                if len(filtered_songs) >= page_size:
-                    break
-                    
-                # Check if we already know if this song has a thumbnail
-                song_id = str(song['id'])
-                has_thumbnail = app.thumbnail_existence_cache.get(song_id)
-                
-                if has_thumbnail is None:
-                    # Format the song_id to match the B2 format (6 digits with leading zeros)
-                    try:
-                        # Remove any leading zeros first
-                        clean_id = song_id.lstrip('0')
-                        
-                        # Format to 6 digits with leading zeros
-                        formatted_id = clean_id.zfill(6)
-                        
-                        # Generate the thumbnail path
-                        thumbnail_path = f"thumbnails/{formatted_id}.png"
-                        
-                        # Check if the thumbnail exists in B2
-                        try:
-                            # Use head_object to check existence without downloading
-                            s3_client.head_object(Bucket=B2_BUCKET_NAME, Key=thumbnail_path)
-                            has_thumbnail = True
-                        except Exception:
-                            has_thumbnail = False
-                            
-                        # Store result in cache
-                        app.thumbnail_existence_cache[song_id] = has_thumbnail
-                    except Exception as e:
-                        logger.error(f"Error checking thumbnail for song {song_id}: {str(e)}")
-                        has_thumbnail = False  # Assume no thumbnail on error
-                
-                if has_thumbnail:
-                    filtered_songs.append(song)
-                else:
-                    filtered_count += 1
-            
-            logger.info(f"Filtered out {filtered_count} songs without thumbnails")
-            songs = filtered_songs
+        rows = rpc_response.data or []
+        songs = [row['song'] for row in rows]
+        total_count = rows[0]['total'] if rows else 0
+        logger.info("Retrieved %d songs (total: %s)", len(songs), total_count)
         
-        # Check if we need to fetch more songs
-        while thumbnails_only and len(songs) < page_size and (offset + expanded_limit) < total_count:
-            # Fetch the next batch
-            next_offset = offset + expanded_limit
-            next_limit = page_size
-            
-            logger.info(f"Fetching additional songs from offset {next_offset}")
-            
-            # Build another query for more songs
-            more_query = supabase.table('songs').select('*')
-            
-            # Apply same ordering
-            if random_mode:
-                more_query = more_query.order('random()', desc=False)
-            else:
-                more_query = more_query.order('updated_at', desc=True)
-                
-            # Apply new pagination range
-            more_query = more_query.range(next_offset, next_offset + next_limit - 1)
-            
-            # Execute query
-            more_response = more_query.execute()
-            
-            if not more_response.data:
-                break  # No more songs
-                
-            # Filter these songs too
-            for song in more_response.data:
-                # Check if we have enough songs
-                if len(songs) >= page_size:
-                    break
-                    
-                # Same thumbnail check logic
-                song_id = str(song['id'])
-                has_thumbnail = app.thumbnail_existence_cache.get(song_id)
-                
-                if has_thumbnail is None:
-                    try:
-                        clean_id = song_id.lstrip('0')
-                        formatted_id = clean_id.zfill(6)
-                        thumbnail_path = f"thumbnails/{formatted_id}.png"
-                        
-                        try:
-                            s3_client.head_object(Bucket=B2_BUCKET_NAME, Key=thumbnail_path)
-                            has_thumbnail = True
-                        except Exception:
-                            has_thumbnail = False
-                            
-                        app.thumbnail_existence_cache[song_id] = has_thumbnail
-                    except Exception as e:
-                        logger.error(f"Error checking thumbnail for song {song_id}: {str(e)}")
-                        has_thumbnail = False
-                
-                if has_thumbnail:
-                    songs.append(song)
-            
-            # Update offset for next query if needed
-            offset = next_offset + next_limit
-            
-            # Safety check to prevent infinite loop
-            if not more_response.data:
-                break
-        
-        # Return filtered results
-        return jsonify({
-            'songs': songs[:page_size],  # Ensure we don't return more than requested
-            'total': len(songs),  # This is now the count of songs with thumbnails
+        # Return results
+        result = {
+            'songs': songs,
+            'total': total_count,
             'offset': offset,
             'limit': page_size,
-            'has_more': len(songs) > page_size or (offset + len(songs)) < total_count,
+            'has_more': (offset + len(songs)) < total_count,
             'random': random_mode,
             'thumbnails_only': thumbnails_only,
             'tag': tag
-        })
+        }
+        body = orjson.dumps(result)
+        if not random_mode:
+            with _cache_lock:
+                _songs_cache[cache_key] = body
+        return Response(body, mimetype='application/json')
     except Exception as e:
         logger.error(f"Error getting songs: {e}")
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
 
 @app.route('/api/stream/<song_id>')
 def stream_song(song_id):
@@ -428,34 +580,46 @@ def stream_song(song_id):
         if ':' in song_id:
             song_id = song_id.split(':')[0]
             
-        logger.info(f"Streaming request for song ID: {song_id}")
+        logger.info("Streaming request for song ID: %s", song_id)
+        
+        # Song IDs are numeric, so anything else can't exist
+        if not (song_id.isascii() and song_id.isdigit()):
+            logger.error(f"Invalid song ID {song_id}")
+            return _json({'error': 'Song not found'}, 404)
+            
+        # Fetch song data from the cache or Supabase
+        _sync_cache_epoch()
+        with _cache_lock:
+            song_data = _song_meta_cache.get(song_id)
         
-        # Check for test request - return a success response for HEAD requests to any ID
-        # This allows the AudioPlayer's range check to succeed even during initial load
-        if request.method == 'HEAD' and (song_id == 'test' or song_id == '1'):
-            logger.info(f"Received HEAD request for test song ID {song_id}, returning 200 OK")
+        if song_data is None:
+            response = supabase.table('songs').select(SONG_STREAM_COLUMNS).eq('id', song_id).limit(1).execute()
+            
+            if not response.data:
+                logger.error(f"Song with ID {song_id} not found")
+                return _json({'error': 'Song not found'}, 404)
+                
+            song_data = response.data[0]
+            with _cache_lock:
+                _song_meta_cache[song_id] = song_data
+        logger.info("Found song data: %s", song_data.get('title', 'Unknown'))
+        
+        # Answer HEAD requests without touching B2 - the AudioPlayer's existence and range
+        # check only needs the status and the Accept-Ranges header
+        if request.method == 'HEAD':
+            logger.info("Received HEAD request for song ID %s, returning 200 OK", song_id)
             response = Response('', content_type='audio/mpeg')
             response.headers['Accept-Ranges'] = 'bytes'
-            response.headers['Content-Length'] = '0'  # No content for test
+            response.headers['Content-Length'] = '0'  # No content for range probes
             return response
-            
-        # Fetch song data from Supabase
-        response = supabase.table('songs').select('*').eq('id', song_id).execute()
-        
-        if not response.data:
-            logger.error(f"Song with ID {song_id} not found")
-            return jsonify({'error': 'Song not found'}), 404
-            
-        song_data = response.data[0]
-        logger.info(f"Found song data: {song_data['title'] if 'title' in song_data else 'Unknown'}")
         
         if 'storage_path' not in song_data:
             logger.error("Missing storage_path in song data")
-            return jsonify({'error': 'Invalid song data - missing storage path'}), 500
+            return _json({'error': 'Invalid song data - missing storage path'}, 500)
             
         # Generate a pre-signed URL for the B2 object
         storage_path = song_data['storage_path']
-        logger.info(f"Generating pre-signed URL for: {storage_path}")
+        logger.info("Generating pre-signed URL for: %s", storage_path)
         
         # Determine content type based on file extension
         if storage_path.lower().endswith('.mp3'):
@@ -468,40 +632,43 @@ def stream_song(song_id):
             content_type = 'audio/mpeg'  # Default to MP3
             
         try:
-            # Generate presigned URL with longer expiration
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': B2_BUCKET_NAME,
-                    'Key': storage_path
-                },
-                ExpiresIn=3600  # URL valid for 1 hour
-            )
-            logger.info(f"Successfully generated presigned URL")
-            
-            # Simple proxy approach - forward the request to B2 and stream the response back
+            # Generate (or reuse) a presigned URL
+            presigned_url = _presign(storage_path)
+            logger.info("Successfully generated presigned URL")
+            
+            # With STREAM_REDIRECT=True let B2 serve the audio (including range requests)
+            # directly instead of pinning a worker to relay every byte. The player loads
+            # audio with crossOrigin='anonymous', so this needs the bucket CORS rule
+            # described in setup_connections.txt; ?proxy=1 still forces the proxy
+            if STREAM_REDIRECT and request.args.get('proxy') != '1':
+                redirect_response = redirect(presigned_url, code=302)
+                # Cached presigned URLs can be up to 30 minutes old, so only let the
+                # browser reuse the redirect for the remaining guaranteed validity
+                redirect_response.headers['Cache-Control'] = 'private, max-age=1800'
+                return redirect_response
+            
+            # Proxy approach (default) - forward the request to B2 and stream the response back
             # This avoids CORS issues entirely as the request comes from our server
             
             # Forward the Range header if it exists
             headers = {}
             if 'Range' in request.headers:
                 headers['Range'] = request.headers['Range']
-                logger.info(f"Forwarding Range header: {headers['Range']}")
+                logger.info("Forwarding Range header: %s", headers['Range'])
             
             # Make request to B2
-            logger.info(f"Making request to B2 for audio content")
-            b2_response = requests.get(presigned_url, headers=headers, stream=True)
+            logger.info("Making request to B2 for audio content")
+            b2_response = _b2_session.get(presigned_url, headers=headers, stream=True)
             
             # Log response details
             status_code = b2_response.status_code
-            response_headers = dict(b2_response.headers)
-            logger.info(f"B2 response status: {status_code}, headers: {response_headers}")
+            response_headers = b2_response.headers
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("B2 response status: %s, headers: %s", status_code, dict(response_headers))
             
             # Create a Flask response that streams the content
             def generate():
-                for chunk in b2_response.iter_content(chunk_size=8192):
-                    if chunk:
-                        yield chunk
+                yield from b2_response.iter_content(chunk_size=65536)
             
             # Create appropriate response based on whether it's a range request
             if status_code == 206:  # Partial content for range requests
@@ -538,16 +705,16 @@ def stream_song(song_id):
                 'Expires': '86400'
             })
             
-            logger.info(f"Successfully streaming audio content, content-type: {content_type}")
+            logger.info("Successfully streaming audio content, content-type: %s", content_type)
             return flask_response
             
         except Exception as e:
             logger.error(f"Error in streaming process: {str(e)}", exc_info=True)
-            return jsonify({'error': f'Streaming error: {str(e)}'}), 500
+            return _json({'error': f'Streaming error: {str(e)}'}, 500)
             
     except Exception as e:
         logger.error(f"Error in stream_song endpoint: {str(e)}", exc_info=True)
-        return jsonify({'error': f'Server error: {str(e)}'}), 500
+        return _json({'error': f'Server error: {str(e)}'}, 500)
 
 @app.route('/api/thumbnail/<song_id>', methods=['GET'])
 def api_get_thumbnail(song_id):
@@ -563,29 +730,22 @@ def api_get_thumbnail(song_id):
     if do_log:
         app.logger.info(f"Thumbnail endpoint called for song ID: {song_id} (request #{app.thumbnail_request_counter})")
     
-    # Create a cached directory for thumbnails if it doesn't exist
-    cache_dir = os.path.join(app.root_path, 'thumbnails_cache')
-    os.makedirs(cache_dir, exist_ok=True)
+    formatted_id = _thumb_stem(song_id)
+    thumbnail_path = _thumb_key(song_id)
     
-    # Limit the number of files in the cache directory to prevent disk space issues
-    try:
-        cache_files = os.listdir(cache_dir)
-        if len(cache_files) > 1000:  # Limit to 1000 cached thumbnails
-            # Remove oldest 200 files to make space
-            cache_files.sort(key=lambda f: os.path.getmtime(os.path.join(cache_dir, f)))
-            for old_file in cache_files[:200]:
-                try:
-                    os.remove(os.path.join(cache_dir, old_file))
-                    if do_log:
-                        app.logger.info(f"Removed old cached thumbnail: {old_file}")
-                except Exception as e:
-                    if do_log:
-                        app.logger.warning(f"Failed to remove old cache file {old_file}: {str(e)}")
-    except Exception as e:
-        if do_log:
-            app.logger.warning(f"Failed to clean cache directory: {str(e)}")
+    # By default send the browser straight to B2 so thumbnails never pass through Flask
+    if request.args.get('proxy') != '1':
+        if not _thumbnail_exists(formatted_id):
+            if do_log:
+                app.logger.info(f"No thumbnail in bucket index for song ID: {song_id}")
+            return _placeholder_response(do_log)
+        response = redirect(_presign(thumbnail_path, expires_in=THUMBNAIL_URL_EXPIRY), code=302)
+        response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+        return response
     
-    cache_path = os.path.join(cache_dir, f"{song_id}.png")
+    # Proxy mode (?proxy=1): serve from a local disk cache filled from B2
+    cache_name = f"{song_id}.png"
+    cache_path = os.path.join(THUMBNAIL_CACHE_DIR, cache_name)
     
     # Check if we have a cached version (with a time limit to refresh cache occasionally)
     if os.path.exists(cache_path):
@@ -595,45 +755,47 @@ def api_get_thumbnail(song_id):
         if cache_age < 86400:  # 24 hours in seconds
             if do_log:
                 app.logger.info(f"Returning cached thumbnail for song ID: {song_id} (age: {cache_age:.1f}s)")
+            with _cache_lock:
+                if cache_name in _thumb_lru:
+                    _thumb_lru.move_to_end(cache_name)
+                else:
+                    _thumb_lru[cache_name] = cache_time
             return send_file(cache_path, mimetype='image/png')
         elif do_log:
             app.logger.info(f"Cache expired for song ID: {song_id} (age: {cache_age:.1f}s)")
     
-    # Format the song_id to match the B2 format (exactly 6 digits with leading zeros)
     try:
-        # Remove any leading zeros first
-        clean_id = song_id.lstrip('0')
-        
-        # Format to 6 digits with leading zeros
-        formatted_id = clean_id.zfill(6)
-        
-        if do_log:
-            app.logger.info(f"Formatted song ID from {song_id} to {formatted_id} for B2 path")
-        
-        # Generate the thumbnail path - must be exactly thumbnails/XXXXXX.png (6 digits)
-        thumbnail_path = f"thumbnails/{formatted_id}.png"
         if do_log:
             app.logger.info(f"Attempting to get thumbnail from: {thumbnail_path}")
         
         try:
-            # Generate presigned URL with S3 client
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': B2_BUCKET_NAME, 'Key': thumbnail_path},
-                ExpiresIn=3600
-            )
+            # Generate (or reuse) a presigned URL
+            presigned_url = _presign(thumbnail_path)
             
             if do_log:
                 app.logger.info(f"Generated presigned URL for thumbnail")
             
+            # Revalidate an expired cache file instead of downloading it again
+            headers = {}
+            if os.path.exists(cache_path):
+                headers['If-Modified-Since'] = formatdate(os.path.getmtime(cache_path), usegmt=True)
+            
             # Try to download the thumbnail with a short timeout
-            response = requests.get(presigned_url, timeout=3)
-            if response.status_code == 200:
+            response = _b2_session.get(presigned_url, headers=headers, timeout=3)
+            if response.status_code == 304:
+                # Unchanged in B2 - mark the cached copy as fresh again
+                os.utime(cache_path, None)
+                _thumb_cache_add(cache_name)
+                if do_log:
+                    app.logger.info(f"Thumbnail not modified, refreshed cache: {cache_path}")
+                return send_file(cache_path, mimetype='image/png')
+            elif response.status_code == 200:
                 # Save to cache and return
                 with open(cache_path, 'wb') as f:
                     f.write(response.content)
                 if do_log:
                     app.logger.info(f"Thumbnail saved to cache: {cache_path}")
+                _thumb_cache_add(cache_name)
                 return send_file(cache_path, mimetype='image/png')
             else:
                 if do_log:
@@ -650,19 +812,29 @@ def api_get_thumbnail(song_id):
             app.logger.error(f"Error in thumbnail processing: {str(e)}")
         # Fall back to placeholder
     
-    # Return a placeholder image if anything fails
-    placeholder_path = os.path.join(app.root_path, 'static', 'placeholder.png')
-    if os.path.exists(placeholder_path):
-        if do_log:
-            app.logger.info(f"Returning placeholder image from {placeholder_path}")
-        return send_file(placeholder_path, mimetype='image/png')
-    else:
-        if do_log:
-            app.logger.error(f"Placeholder image not found at: {placeholder_path}")
-        # Create a simple 1x1 transparent PNG as final fallback
-        data = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082')
-        response = Response(data, mimetype='image/png')
-        return response
+    return _placeholder_response(do_log)
+
+def _thumb_cache_add(cache_name):
+    """Record a freshly written cache file and evict the least recently used ones"""
+    evicted = []
+    with _cache_lock:
+        _thumb_lru[cache_name] = time.time()
+        _thumb_lru.move_to_end(cache_name)
+        if len(_thumb_lru) > THUMBNAIL_CACHE_SIZE:
+            # Remove oldest 200 files to make space
+            for _ in range(200):
+                evicted.append(_thumb_lru.popitem(last=False)[0])
+    for old_file in evicted:
+        try:
+            os.remove(os.path.join(THUMBNAIL_CACHE_DIR, old_file))
+        except OSError as e:
+            logger.warning(f"Failed to remove old cache file {old_file}: {str(e)}")
+
+def _placeholder_response(do_log=False):
+    """Return the placeholder thumbnail from memory"""
+    if do_log:
+        app.logger.info("Returning placeholder image")
+    return Response(_PLACEHOLDER_BYTES, mimetype='image/png', headers={'Cache-Control': 'public, max-age=86400'})
 
 # Also make the non-api version work the same way for compatibility
 @app.route('/thumbnail/<song_id>', methods=['GET'])
@@ -686,17 +858,54 @@ def stream_song_options(song_id):
     response = jsonify({'status': 'ok'})
     return response
 
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """
+    Drop cached Supabase reads, e.g. after new songs are ingested.
+    Requires the X-Cache-Token header to match the CACHE_INVALIDATE_TOKEN env variable.
+    Pass {"songId": ...} to only drop that song, otherwise everything is cleared.
+    
+    With REDIS_URL the cache epoch is bumped and every worker clears all of its song
+    caches on its next lookup (songId doesn't narrow that). Without Redis only the
+    worker that received this request is cleared, which the response reports as
+    "scope": "worker".
+    """
+    expected_token = os.getenv('CACHE_INVALIDATE_TOKEN')
+    if not expected_token or request.headers.get('X-Cache-Token') != expected_token:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    song_id = data.get('songId')
+    with _cache_lock:
+        if song_id:
+            _song_meta_cache.pop(str(song_id), None)
+        else:
+            _song_meta_cache.clear()
+        # Any page may contain the song, so song list pages are always dropped
+        _songs_cache.clear()
+    
+    scope = 'worker'
+    if _redis is not None:
+        try:
+            _redis.incr('cache_epoch')
+            scope = 'all_workers'
+        except redis.RedisError as e:
+            logger.warning(f"Redis incr failed for cache_epoch: {str(e)}")
+    
+    logger.info(f"Invalidated caches{f' for song {song_id}' if song_id else ''} ({scope})")
+    return jsonify({'success': True, 'scope': scope})
+
 @app.route('/api/client-logs', methods=['POST'])
 def client_logs():
     """Endpoint to receive client-side logs from the browser"""
     if os.getenv('RAILWAY_ENVIRONMENT_PRODUCTION') == 'True':
         # Don't log in production
-        return jsonify({'status': 'ignored'})
+        return _json({'status': 'ignored'})
     
     try:
         log_data = request.get_json()
         if not log_data or 'logs' not in log_data:
-            return jsonify({'status': 'error', 'message': 'Invalid log data'}), 400
+            return _json({'status': 'error', 'message': 'Invalid log data'}, 400)
         
         logs = log_data['logs']
         for log in logs:
@@ -717,10 +926,10 @@ def client_logs():
             else:
                 frontend_logger.debug(log_message)
         
-        return jsonify({'status': 'success', 'count': len(logs)})
+        return _json({'status': 'success', 'count': len(logs)})
     except Exception as e:
         logger.error(f"Error processing client logs: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return _json({'status': 'error', 'message': str(e)}, 500)
 
 @app.route('/api/song-metadata/<song_id>')
 def get_song_metadata(song_id):
@@ -728,8 +937,13 @@ def get_song_metadata(song_id):
     try:
         logger.info(f"Fetching metadata for song ID: {song_id}")
         
-        # Fetch song data from Supabase including view_count and like_count
-        song_response = supabase.table('songs').select('*').eq('id', song_id).execute()
+        # Fetch song data including view_count and like_count, with its tags embedded
+        # through song_tags so it's a single query
+        song_response = supabase.table('songs') \
+            .select(f"{SONG_DETAIL_COLUMNS},song_tags(tags(name))") \
+            .eq('id', song_id) \
+            .limit(1) \
+            .execute()
         
         if not song_response.data:
             logger.error(f"Song with ID {song_id} not found")
@@ -737,21 +951,8 @@ def get_song_metadata(song_id):
             
         song_data = song_response.data[0]
         
-        # Fetch tags for this song using a direct join query
-        # This works with the existing schema without needing a custom function
-        tags_query = supabase.from_('song_tags') \
-            .select('tags!inner(name)') \
-            .eq('song_id', song_id) \
-            .limit(3)
-            
-        tags_response = tags_query.execute()
-        
-        # Extract tag names from the nested structure
-        tags = []
-        if tags_response.data:
-            for item in tags_response.data:
-                if item.get('tags') and item['tags'].get('name'):
-                    tags.append(item['tags']['name'])
+        # Flatten the embedded song_tags into up to 3 tag names
+        tags = [t['name'] for st in song_data.pop('song_tags', None) or () if (t := st.get('tags')) and t.get('name')][:3]
         
         logger.info(f"Found {len(tags)} tags for song {song_id}: {tags}")
         
@@ -761,12 +962,20 @@ def get_song_metadata(song_id):
             'tags': tags
         }
         
-        return jsonify(metadata)
+        return _cacheable_json(metadata, 'public, max-age=3600')
     except Exception as e:
         logger.error(f"Error fetching song metadata: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def _candidate_song_ids(song_id):
+    """The song ID as given and, if it has leading zeros, without them"""
+    stripped_id = song_id.lstrip('0')
+    if stripped_id and stripped_id != song_id:
+        return [song_id, stripped_id]
+    return [song_id]
+
 @app.route('/api/like-song', methods=['POST'])
+@require_auth
 def like_song():
     """Add a song to the user's liked songs"""
     try:
@@ -779,74 +988,23 @@ def like_song():
         song_id = str(data['songId']).strip()
         logger.info(f"Adding song ID '{song_id}' to liked songs")
         
-        # Get the user ID from the JWT token in the Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            logger.error("Missing or invalid Authorization header")
-            return jsonify({'error': 'Authentication required'}), 401
-            
-        token = auth_header.split(' ')[1]
+        user_id = g.user_id
         
-        # Verify the token with Supabase
         try:
-            user = supabase.auth.get_user(token)
-            user_id = user.user.id
-            logger.info(f"User authenticated: {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to authenticate user: {str(e)}")
-            return jsonify({'error': 'Invalid authentication token'}), 401
-        
-        # Check if the song exists in the database - try multiple approaches
-        found_song = False
-        found_song_id = song_id  # Default to the original ID
-        
-        try:
-            # Try direct exact match first (most reliable)
-            logger.info(f"Checking for song with exact ID: '{song_id}'")
-            song_check = supabase.table('songs').select('id').eq('id', song_id).limit(1).execute()
+            # Look the song up by its exact ID and, for IDs with leading zeros, without
+            # them - in a single query
+            candidate_ids = _candidate_song_ids(song_id)
+            logger.info(f"Checking for song with ID(s): {candidate_ids}")
+            song_check = supabase.table('songs').select('id').in_('id', candidate_ids).execute()
             
-            if song_check.data and len(song_check.data) > 0:
-                found_song = True
-                logger.info(f"Found song with exact ID: {song_id}")
-            else:
-                logger.warning(f"Song with exact ID '{song_id}' not found, trying alternative lookups")
-                
-                # Try numeric ID if the original ID is numeric
-                if song_id.isdigit():
-                    numeric_id = song_id
-                    logger.info(f"Trying with numeric ID: {numeric_id}")
-                    
-                    song_check = supabase.table('songs').select('id').eq('id', numeric_id).limit(1).execute()
-                    if song_check.data and len(song_check.data) > 0:
-                        found_song = True
-                        found_song_id = numeric_id
-                        logger.info(f"Found song with numeric ID: {numeric_id}")
-                
-                # If still not found and ID has leading zeros, try without them
-                if not found_song and song_id.startswith('0'):
-                    stripped_id = song_id.lstrip('0')
-                    if stripped_id:  # Avoid empty string
-                        logger.info(f"Trying with leading zeros removed: {stripped_id}")
-                        song_check = supabase.table('songs').select('id').eq('id', stripped_id).limit(1).execute()
-                        if song_check.data and len(song_check.data) > 0:
-                            found_song = True
-                            found_song_id = stripped_id
-                            logger.info(f"Found song with stripped ID: {stripped_id}")
-                
-                # If still not found, try as a pattern match
-                if not found_song:
-                    logger.info(f"Trying with pattern match for ID: {song_id}")
-                    pattern = f"%{song_id}%"
-                    song_check = supabase.table('songs').select('id').like('id', pattern).limit(1).execute()
-                    if song_check.data and len(song_check.data) > 0:
-                        found_song = True
-                        found_song_id = song_check.data[0]['id']
-                        logger.info(f"Found song with pattern match: {found_song_id}")
-                
-                # If still not found, return error
-                if not found_song:
-                    logger.error(f"Song with ID '{song_id}' not found after all lookup attempts")
-                    return jsonify({'error': 'Song not found in database'}), 404
+            found_ids = {row['id'] for row in song_check.data or []}
+            if not found_ids:
+                logger.error(f"Song with ID '{song_id}' not found")
+                return jsonify({'error': 'Song not found in database'}), 404
+            
+            # Prefer the exact match
+            found_song_id = song_id if song_id in found_ids else candidate_ids[-1]
+            logger.info(f"Found song with ID: {found_song_id}")
             
             # Insert the liked song record with the found song ID
             liked_song = {
@@ -854,29 +1012,20 @@ def like_song():
                 'song_id': found_song_id
             }
             
-            # Check if this song is already liked by the user
-            existing_check = supabase.table('liked_songs').select('*') \
-                .eq('user_id', user_id) \
-                .eq('song_id', found_song_id) \
-                .limit(1) \
-                .execute()
-                
-            if existing_check.data and len(existing_check.data) > 0:
+            # Insert unless the (user_id, song_id) primary key already exists - one
+            # atomic round-trip instead of a check followed by an insert
+            result = supabase.table('liked_songs').upsert(liked_song, ignore_duplicates=True).execute()
+            
+            if not result.data:
                 logger.info(f"Song '{found_song_id}' is already liked by user '{user_id}'")
                 return jsonify({'success': True, 'message': 'Song is already in liked songs'})
-            
-            # Use upsert to handle case where it might already exist
-            result = supabase.table('liked_songs').insert(liked_song).execute()
-            
-            if not result.data or len(result.data) == 0:
-                logger.warning("No data returned from database operation")
-                return jsonify({'success': True, 'message': 'Song added to liked songs (no data returned)'})
                 
+            _invalidate_liked_songs(user_id)
             logger.info(f"Successfully added song '{found_song_id}' to liked songs for user '{user_id}'")
             return jsonify({
                 'success': True, 
                 'message': 'Song added to liked songs',
-                'likedSong': result.data[0] if result.data else None
+                'likedSong': result.data[0]
             })
             
         except Exception as e:
@@ -888,6 +1037,7 @@ def like_song():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/unlike-song', methods=['POST'])
+@require_auth
 def unlike_song():
     """Remove a song from the user's liked songs"""
     try:
@@ -900,50 +1050,26 @@ def unlike_song():
         song_id = str(data['songId']).strip()
         logger.info(f"Removing song ID '{song_id}' from liked songs")
         
-        # Get the user ID from the JWT token in the Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            logger.error("Missing or invalid Authorization header")
-            return jsonify({'error': 'Authentication required'}), 401
-            
-        token = auth_header.split(' ')[1]
+        user_id = g.user_id
         
-        # Verify the token with Supabase
         try:
-            user = supabase.auth.get_user(token)
-            user_id = user.user.id
-            logger.info(f"User authenticated: {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to authenticate user: {str(e)}")
-            return jsonify({'error': 'Invalid authentication token'}), 401
-        
-        # Try to find the song directly first to normalize ID
-        try:
-            song_check = supabase.table('songs').select('id').eq('id', song_id).limit(1).execute()
-            
-            # If not found directly but it's numeric, try with that format
-            if (not song_check.data or len(song_check.data) == 0) and song_id.isdigit():
-                numeric_id = song_id
-                logger.info(f"Trying numeric ID format: {numeric_id}")
-                
-                song_check = supabase.table('songs').select('id').eq('id', numeric_id).limit(1).execute()
-                if song_check.data and len(song_check.data) > 0:
-                    song_id = numeric_id
-                    logger.info(f"Using numeric ID format: {song_id}")
-            
-            # Delete the liked song record - we proceed even if we didn't find the song
-            # since we want to clean up any potentially incorrect entries
-            logger.info(f"Deleting liked song record for user {user_id} and song {song_id}")
+            # Delete the liked song record directly - the song doesn't need to exist,
+            # since we want to clean up any potentially incorrect entries too. Match the
+            # same ID variants like_song resolves, so a like stored without leading
+            # zeros is still removed.
+            candidate_ids = _candidate_song_ids(song_id)
+            logger.info(f"Deleting liked song record for user {user_id} and song(s) {candidate_ids}")
             
             result = supabase.table('liked_songs') \
                 .delete() \
                 .eq('user_id', user_id) \
-                .eq('song_id', song_id) \
+                .in_('song_id', candidate_ids) \
                 .execute()
             
             deleted_count = len(result.data) if hasattr(result, 'data') and result.data else 0
             
             if deleted_count > 0:
+                _invalidate_liked_songs(user_id)
                 logger.info(f"Successfully removed song '{song_id}' from liked songs for user '{user_id}'")
                 return jsonify({
                     'success': True, 
@@ -966,178 +1092,167 @@ def unlike_song():
         logger.error(f"Error removing song from liked songs: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+# Liked songs are fetched from Supabase in pages of this size
+LIKED_SONGS_PAGE_SIZE = 100
+
 @app.route('/api/liked-songs')
+@require_auth
 def get_liked_songs():
     """Get all songs liked by the current user"""
-    try:
-        # Get the user ID from the JWT token in the Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            logger.error("Missing or invalid Authorization header")
-            return jsonify({'success': False, 'error': 'Authentication required'}), 401
-            
-        token = auth_header.split(' ')[1]
-        
-        # Verify the token with Supabase
+    user_id = g.user_id
+    
+    # Debug details are only included on request, and such responses aren't cached
+    include_debug = app.debug or request.args.get('debug') == '1'
+    
+    # Serve from the per-user cache; like/unlike/clear bump the version in its key
+    cache_key = None
+    if LIKED_SONGS_CACHE_ENABLED and not include_debug:
+        version = _liked_songs_version(user_id)
+        if version is not None:
+            cache_key = f"liked:{user_id}:{version}"
+            cached_body = _shared_cache_get(_liked_songs_cache, cache_key)
+            if cached_body is not None:
+                return Response(cached_body, mimetype='application/json')
+    
+    # Fetch the first page up front so query errors still produce a normal error response
+    logger.info(f"Fetching liked songs for user {user_id}")
+    first_page = _fetch_liked_songs_page(user_id)
+    
+    # Stream the songs array page by page so heavy users get the first songs before
+    # the rest are fetched, and cache the complete body once it has been sent
+    def generate():
+        chunks = [b'{"success":true,"songs":[']
+        yield chunks[0]
+        liked = []
+        found_song_ids = []
+        page = first_page
         try:
-            user = supabase.auth.get_user(token)
-            user_id = user.user.id
-            logger.info(f"User authenticated: {user_id}")
+            while True:
+                for item in page:
+                    # Liked songs whose song row no longer exists come back with songs = null
+                    song = item.get('songs')
+                    if not song:
+                        continue
+                    chunks.append((b',' if found_song_ids else b'') + orjson.dumps(song))
+                    found_song_ids.append(song['id'])
+                    yield chunks[-1]
+                liked.extend(page)
+                if len(page) < LIKED_SONGS_PAGE_SIZE:
+                    break
+                page = _fetch_liked_songs_page(user_id, after=page[-1])
         except Exception as e:
-            logger.error(f"Failed to authenticate user: {str(e)}")
-            return jsonify({'success': False, 'error': 'Invalid authentication token'}), 401
+            # The 200 and part of the body are already sent, so close the document with
+            # an error instead of truncating it; the later "success" key wins when parsed
+            logger.error(f"Error streaming liked songs for user {user_id}: {e}")
+            yield b'],"success":false,"error":' + orjson.dumps(str(e)) + b'}'
+            return
+        logger.info(f"Found {len(found_song_ids)} songs out of {len(liked)} liked songs for user {user_id}")
         
-        # Query for the user's liked songs with song details
-        try:
-            # First get the liked song IDs
-            logger.info(f"Fetching liked songs for user {user_id}")
-            liked_songs_response = supabase.table('liked_songs') \
-                .select('song_id, created_at') \
-                .eq('user_id', user_id) \
-                .order('created_at', desc=True) \
-                .execute()
-                
-            if not liked_songs_response.data:
-                logger.info(f"No liked songs found for user {user_id}")
-                return jsonify({
-                    'success': True, 
-                    'songs': [], 
-                    'debug': {
-                        'userId': user_id, 
-                        'message': 'No liked songs found',
-                        'timestamp': datetime.datetime.now().isoformat()
-                    }
-                })
-                
-            # Extract song IDs
-            song_ids = [str(item['song_id']) for item in liked_songs_response.data if item.get('song_id')]
-            
-            if not song_ids:
-                logger.warning(f"Found liked_songs entries but no valid song_ids for user {user_id}")
-                return jsonify({
-                    'success': True, 
-                    'songs': [], 
-                    'debug': {
-                        'userId': user_id,
-                        'rawLikedSongs': liked_songs_response.data,
-                        'message': 'No valid song IDs found',
-                        'timestamp': datetime.datetime.now().isoformat()
-                    }
-                })
-            
-            logger.info(f"Found {len(song_ids)} liked song IDs: {song_ids}")
-            
-            # Get the full song details
-            songs_response = supabase.table('songs') \
-                .select('*') \
-                .in_('id', song_ids) \
-                .execute()
-                
-            found_songs = songs_response.data if hasattr(songs_response, 'data') else []
-            found_song_ids = [str(song['id']) for song in found_songs if song.get('id')]
-            
-            # Find missing song IDs
+        if include_debug:
+            # IDs are TEXT in the schema, so no str() coercion is needed
+            song_ids = [item['song_id'] for item in liked if item.get('song_id')]
             missing_song_ids = list(set(song_ids) - set(found_song_ids))
-            
-            logger.info(f"Found {len(found_songs)} songs out of {len(song_ids)} liked song IDs")
             if missing_song_ids:
                 logger.warning(f"Missing songs: {missing_song_ids}")
-            
-            # Format response with helpful debug info
-            return jsonify({
-                'success': True, 
-                'songs': found_songs,
-                'debug': {
-                    'userId': user_id,
-                    'likedSongIds': song_ids,
-                    'foundSongIds': found_song_ids,
-                    'missingSongIds': missing_song_ids,
-                    'songsFound': len(found_songs),
-                    'likedSongsCount': len(song_ids),
-                    'timestamp': datetime.datetime.now().isoformat()
-                }
-            })
-            
-        except Exception as e:
-            logger.error(f"Database error fetching liked songs: {str(e)}")
-            return jsonify({'success': False, 'error': f'Database error: {str(e)}'}), 500
-            
-    except Exception as e:
-        logger.error(f"Error fetching liked songs: {str(e)}", exc_info=True)
-        return jsonify({'success': False, 'error': str(e)}), 500
+            debug = {
+                'userId': user_id,
+                'likedSongIds': song_ids,
+                'foundSongIds': found_song_ids,
+                'missingSongIds': missing_song_ids,
+                'songsFound': len(found_song_ids),
+                'likedSongsCount': len(song_ids),
+                'timestamp': datetime.datetime.now().isoformat()
+            }
+            yield b'],"debug":' + orjson.dumps(debug) + b'}'
+            return
+        chunks.append(b']}')
+        yield chunks[-1]
+        if cache_key is not None:
+            _shared_cache_set(_liked_songs_cache, cache_key, b''.join(chunks))
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def _fetch_liked_songs_page(user_id, after=None):
+    """
+    One page of a user's liked songs, newest first, with song details embedded through
+    the liked_songs.song_id foreign key so each page is a single round-trip.
+    
+    Pages continue after the last row of the previous page (keyset on created_at, song_id),
+    so likes and unlikes during a stream can't shift rows into or out of later pages.
+    """
+    query = supabase.table('liked_songs') \
+        .select(f"song_id, created_at, songs({SONG_LIST_COLUMNS})") \
+        .eq('user_id', user_id)
+    if after is not None:
+        created_at, song_id = after['created_at'], after['song_id']
+        query = query.or_(
+            f'created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",song_id.gt."{song_id}")'
+        )
+    response = query \
+        .order('created_at', desc=True) \
+        .order('song_id') \
+        .limit(LIKED_SONGS_PAGE_SIZE) \
+        .execute()
+    return response.data or []
+
+def _invalidate_liked_songs(user_id):
+    """Drop a user's cached liked songs after they change"""
+    if LIKED_SONGS_CACHE_ENABLED:
+        _bump_liked_songs_version(user_id)
 
 @app.route('/api/songs/details/<song_id>')
 def get_song_details(song_id):
     """Get details for a specific song by ID"""
+    logger.info(f"Fetching details for song ID: {song_id}")
+    
+    # Query the song by ID
+    song_query = supabase.table('songs').select(SONG_DETAIL_COLUMNS).eq('id', song_id).limit(1)
+    song_result = song_query.execute()
+    
+    if not song_result.data:
+        logger.error(f"Song with ID {song_id} not found")
+        return jsonify({"error": "Song not found"}), 404
+    
+    song = song_result.data[0]
+    
+    # Return song details
+    return jsonify(song)
+
+def _clear_liked_songs_task(user_id):
+    """Delete all liked songs for a user; runs on the background executor"""
     try:
-        logger.info(f"Fetching details for song ID: {song_id}")
-        
-        # Query the song by ID
-        song_query = supabase.table('songs').select('*').eq('id', song_id).limit(1)
-        song_result = song_query.execute()
-        
-        if not song_result.data:
-            logger.error(f"Song with ID {song_id} not found")
-            return jsonify({"error": "Song not found"}), 404
-        
-        song = song_result.data[0]
-        
-        # Return song details
-        return jsonify(song)
-        
+        # Ask PostgREST for the affected row count only (Prefer: return=minimal, count=exact)
+        # instead of shipping every deleted row back just to len() it
+        result = supabase.table('liked_songs') \
+            .delete(count='exact', returning='minimal') \
+            .eq('user_id', user_id) \
+            .execute()
+
+        deleted_count = result.count if getattr(result, 'count', None) is not None else 0
+        _invalidate_liked_songs(user_id)
+        logger.info(f"Successfully deleted {deleted_count} liked songs for user {user_id}")
     except Exception as e:
-        logger.error(f"Error fetching song details: {str(e)}", exc_info=True)
-        return jsonify({"error": "Failed to fetch song details"}), 500
+        logger.error(f"Error clearing liked songs for user {user_id}: {str(e)}", exc_info=True)
 
 @app.route('/api/liked-songs/clear', methods=['POST'])
+@require_auth
 def clear_liked_songs():
     """Clear all liked songs for the current user"""
-    try:
-        # Extract the token from the Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            logger.error("Missing or invalid Authorization header")
-            return jsonify({'success': False, 'error': 'Authentication required'}), 401
-            
-        token = auth_header.split(' ')[1]
-        
-        # Verify the token with Supabase
-        try:
-            user = supabase.auth.get_user(token)
-            user_id = user.user.id
-            logger.info(f"User authenticated: {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to authenticate user: {str(e)}")
-            return jsonify({'success': False, 'error': 'Invalid authentication token'}), 401
-        
-        logger.info(f"Clearing all liked songs for user: {user_id}")
-        
-        # Delete all liked songs for this user
-        try:
-            # Using Supabase query to delete all liked songs for the user
-            result = supabase.table('liked_songs').delete().eq('user_id', user_id).execute()
-            
-            # Check if there was an error
-            if hasattr(result, 'error') and result.error:
-                logger.error(f"Database error when clearing liked songs: {result.error}")
-                return jsonify({'success': False, 'error': 'Database error'}), 500
-                
-            # Get the count of deleted items
-            deleted_count = len(result.data) if hasattr(result, 'data') else 0
-            logger.info(f"Successfully deleted {deleted_count} liked songs for user {user_id}")
-            
-            return jsonify({
-                'success': True,
-                'message': f'Successfully cleared {deleted_count} liked songs'
-            })
-            
-        except Exception as e:
-            logger.error(f"Error clearing liked songs: {str(e)}")
-            return jsonify({'success': False, 'error': f'Database error: {str(e)}'}), 500
-            
-    except Exception as e:
-        logger.error(f"Error in clear_liked_songs: {str(e)}", exc_info=True)
-        return jsonify({'success': False, 'error': str(e)}), 500
+    user_id = g.user_id
+    
+    logger.info(f"Clearing all liked songs for user: {user_id}")
+    
+    # The delete is scoped to user_id and idempotent, so run it in the background
+    # and accept the request right away instead of holding it for a large delete
+    background_executor.submit(_clear_liked_songs_task, user_id)
+    _invalidate_liked_songs(user_id)
+    
+    return jsonify({
+        'success': True,
+        'status': 'accepted',
+        'message': 'Clearing liked songs'
+    }), 202
 
 @app.route('/auth/callback')
 def auth_callback():
@@ -1269,19 +1384,22 @@ def get_top_tags_api():
         # Get the limit parameter from the request, default to 15
         limit = request.args.get('limit', default=15, type=int)
         
-        # Import the get_top_tags function here to avoid circular imports
-        from get_top_tags import get_top_tags
-        
-        # Get the top tags with the specified limit
-        top_tags = get_top_tags(limit)
-        
-        # Format the response
-        formatted_tags = [{"name": tag_name, "count": count} for tag_name, count in top_tags]
+        # Tag counts change slowly, so reuse them for 5 minutes
+        cached_tags = _shared_cache_get(_top_tags_cache, f"top_tags:{limit}")
+        if cached_tags is not None:
+            formatted_tags = orjson.loads(cached_tags)
+        else:
+            # Get the top tags with the specified limit, using this app's client
+            top_tags = get_top_tags(limit, client=supabase)
+            
+            # Format the response
+            formatted_tags = [{"name": tag_name, "count": count} for tag_name, count in top_tags]
+            _shared_cache_set(_top_tags_cache, f"top_tags:{limit}", orjson.dumps(formatted_tags))
         
-        return jsonify({
+        return _cacheable_json({
             "success": True,
             "tags": formatted_tags
-        })
+        }, 'public, max-age=300, stale-while-revalidate=600')
     except Exception as e:
         logger.error(f"Error getting top tags: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
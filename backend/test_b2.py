@@ -1,27 +1,151 @@
 import boto3
 from botocore.client import Config
 import os
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
 
+# Get credentials from env
+B2_KEY_ID = os.getenv('B2_KEY_ID')
+B2_APP_KEY = os.getenv('B2_APP_KEY')
+B2_BUCKET_NAME = os.getenv('B2_BUCKET_NAME')
+
+# Format credentials and endpoint for B2 compatibility
+B2_ENDPOINT = 'https://s3.eu-central-003.backblazeb2.com'  # Use B2's S3-compatible endpoint
+
+# Reuse HTTPS connections across downloads instead of a new TCP+TLS handshake per call
+session = requests.Session()
+session.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """Create the S3 client for B2 once and reuse it for every call"""
+    return boto3.client(
+        's3',
+        endpoint_url=B2_ENDPOINT,
+        aws_access_key_id=B2_KEY_ID,
+        aws_secret_access_key=B2_APP_KEY,
+        region_name='eu-central-003',
+        # Keep max_pool_connections >= the number of concurrent requests, otherwise
+        # botocore discards pooled connections and re-handshakes TLS
+        config=Config(
+            signature_version='s3v4',
+            max_pool_connections=64,
+            tcp_keepalive=True,
+            retries={'max_attempts': 3, 'mode': 'adaptive'},
+            s3={
+                'addressing_style': 'path',
+                'payload_signing_enabled': False
+            }
+        )
+    )
+
+def presign_many(keys, bucket, expires=3600):
+    """Generate presigned GET URLs for many keys with the client's request signer
+
+    Skips the per-call event dispatch and parameter validation that
+    generate_presigned_url goes through for every key.
+    """
+    s3_client = get_s3_client()
+    request_signer = s3_client._request_signer
+    endpoint_url = s3_client.meta.endpoint_url
+    urls = []
+    for key in keys:
+        # Path-style addressing: <endpoint>/<bucket>/<key>
+        url_path = f"/{bucket}/{quote(key)}"
+        request_dict = {
+            'url_path': url_path,
+            'url': endpoint_url + url_path,
+            'query_string': {},
+            'method': 'GET',
+            'headers': {},
+            'body': b'',
+            'context': {},
+        }
+        urls.append(request_signer.generate_presigned_url(
+            request_dict, operation_name='GetObject', expires_in=expires))
+    return urls
+
+def presign_parallel(keys, bucket, expires=3600, max_workers=32):
+    """Generate presigned GET URLs for a batch of keys on a thread pool sharing one client
+
+    max_workers should stay at or below the client's max_pool_connections.
+    """
+    s3_client = get_s3_client()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda key: s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket, 'Key': key},
+                ExpiresIn=expires
+            ),
+            keys
+        ))
+
+# Size of each byte range fetched by download_ranged
+RANGE_PART_SIZE = 8 * 1024 * 1024
+
+def download_ranged(bucket, key, local_filename, part_size=RANGE_PART_SIZE, max_workers=16):
+    """Download one object as parallel byte-range GETs written into place with pwrite
+    (or a locked seek + write where os.pwrite doesn't exist, e.g. on Windows)"""
+    s3_client = get_s3_client()
+    size = s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+
+    # O_BINARY only exists (and matters) on Windows
+    fd = os.open(local_filename, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        os.ftruncate(fd, size)
+
+        if hasattr(os, 'pwrite'):
+            def write_at(view, offset):
+                return os.pwrite(fd, view, offset)
+        else:
+            # seek + write share the file position, so parts must not interleave them
+            write_lock = threading.Lock()
+
+            def write_at(view, offset):
+                with write_lock:
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    return os.write(fd, view)
+
+        def fetch(start):
+            end = min(start + part_size, size) - 1
+            body = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")['Body']
+            # Write each piece at its own offset as it arrives, so no part is held in memory whole
+            offset = start
+            for chunk in body.iter_chunks(chunk_size=1 << 20):
+                view = memoryview(chunk)
+                while view:
+                    written = write_at(view, offset)
+                    offset += written
+                    view = view[written:]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # list() so any exception from a part is raised here
+            list(executor.map(fetch, range(0, size, part_size)))
+    finally:
+        os.close(fd)
+    return size
+
 def test_b2_access():
     print("Testing B2 Access...")
     
-    # Get credentials from env
-    B2_KEY_ID = os.getenv('B2_KEY_ID')
-    B2_APP_KEY = os.getenv('B2_APP_KEY')
-    B2_BUCKET_NAME = os.getenv('B2_BUCKET_NAME')
-    
     if not all([B2_KEY_ID, B2_APP_KEY, B2_BUCKET_NAME]):
         print("Error: Missing required B2 credentials in .env file")
         return None
     
-    # Format credentials and endpoint for B2 compatibility
-    B2_ENDPOINT = 'https://s3.eu-central-003.backblazeb2.com'  # Use B2's S3-compatible endpoint
-    
     print(f"\nCredentials loaded:")
     print(f"Key ID: {B2_KEY_ID[:10]}...")  # Show first part of key ID
     print(f"Bucket: {B2_BUCKET_NAME}")
@@ -30,20 +154,7 @@ def test_b2_access():
     try:
         # Initialize S3 client
         print("\nInitializing S3 client...")
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=B2_ENDPOINT,
-            aws_access_key_id=B2_KEY_ID,
-            aws_secret_access_key=B2_APP_KEY,
-            region_name='eu-central-003',
-            config=Config(
-                signature_version='s3v4',
-                s3={
-                    'addressing_style': 'path',
-                    'payload_signing_enabled': True
-                }
-            )
-        )
+        s3_client = get_s3_client()
 
         # Test the connection
         response = s3_client.list_objects_v2(Bucket=B2_BUCKET_NAME)
@@ -69,34 +180,32 @@ def test_download_mp3(s3_client, bucket_name, file_key):
         
         # Generate a pre-signed URL for the object
         print("Generating pre-signed URL...")
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': bucket_name,
-                'Key': file_key
-            },
-            ExpiresIn=3600  # URL valid for 1 hour
-        )
+        presigned_url = presign_many([file_key], bucket_name, expires=3600)[0]  # URL valid for 1 hour
         print(f"Generated URL (first 100 chars): {presigned_url[:100]}...")
         
         # Try to download the file
         print("\nTesting download...")
-        response = requests.get(presigned_url, stream=True)
-        
-        if response.status_code == 200:
-            # Save the file locally
-            local_filename = os.path.join(os.path.dirname(__file__), "test_download.mp3")
-            total_size = 0
-            with open(local_filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        total_size += len(chunk)
-                        f.write(chunk)
-            
-            print(f"Success! Downloaded {total_size/1024/1024:.2f} MB to {local_filename}")
-        else:
-            print(f"Failed to download. Status code: {response.status_code}")
-            print(f"Error message: {response.text}")
+        with session.get(presigned_url, stream=True) as response:
+            if response.status_code == 200:
+                # Save the file locally, copying straight from the raw urllib3 stream
+                local_filename = os.path.join(os.path.dirname(__file__), "test_download.mp3")
+                # Read into one reusable buffer so the loop doesn't allocate a bytes object per chunk
+                response.raw.decode_content = True
+                buf = bytearray(1 << 20)
+                mv = memoryview(buf)
+                total_size = 0
+                with open(local_filename, 'wb') as f:
+                    while True:
+                        n = response.raw.readinto(buf)
+                        if not n:
+                            break
+                        f.write(mv[:n])
+                        total_size += n
+                
+                print(f"Success! Downloaded {total_size/1024/1024:.2f} MB to {local_filename}")
+            else:
+                print(f"Failed to download. Status code: {response.status_code}")
+                print(f"Error message: {response.text}")
             
     except Exception as e:
         print(f"Error during download test: {e}")
@@ -106,3 +215,8 @@ if __name__ == "__main__":
     if result:
         s3_client, bucket_name, file_key = result
         test_download_mp3(s3_client, bucket_name, file_key)
+        
+        print("\nTesting ranged download...")
+        local_filename = os.path.join(os.path.dirname(__file__), "test_download_ranged.mp3")
+        total_size = download_ranged(bucket_name, file_key, local_filename)
+        print(f"Success! Downloaded {total_size/1024/1024:.2f} MB to {local_filename}")
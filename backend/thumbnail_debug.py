@@ -7,14 +7,18 @@ It provides functions to check thumbnail cache, B2 connectivity, and browser beh
 """
 
 import os
+import hashlib
 import sys
 import shutil
 import requests
 import logging
-from flask import Flask, jsonify, send_file, Response
+import threading
+from functools import lru_cache
+from flask import Flask, jsonify, request, Response
 from dotenv import load_dotenv
 import boto3
 from botocore.client import Config
+from cachetools import TTLCache, cached
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
@@ -32,31 +36,64 @@ B2_KEY_ID = os.getenv('B2_KEY_ID')
 B2_APP_KEY = os.getenv('B2_APP_KEY')
 B2_BUCKET_NAME = os.getenv('B2_BUCKET_NAME')
 
-# Initialize S3 client for B2
-s3_client = None
-if B2_KEY_ID and B2_APP_KEY:
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """Create the S3 client for B2 on first use and reuse it afterwards"""
+    if not (B2_KEY_ID and B2_APP_KEY):
+        logger.warning("B2 credentials not found in environment variables")
+        return None
     try:
         s3_client = boto3.client(
             's3',
             endpoint_url='https://s3.us-west-004.backblazeb2.com',
             aws_access_key_id=B2_KEY_ID,
             aws_secret_access_key=B2_APP_KEY,
-            config=Config(signature_version='s3v4')
+            # Keep max_pool_connections >= the number of concurrent thumbnail requests,
+            # otherwise botocore discards pooled connections and re-handshakes TLS
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=64,
+                tcp_keepalive=True,
+                retries={'max_attempts': 3, 'mode': 'adaptive'},
+                s3={'addressing_style': 'path', 'payload_signing_enabled': False}
+            )
         )
         logger.info("B2 client initialized")
+        return s3_client
     except Exception as e:
         logger.error(f"Failed to initialize B2 client: {str(e)}")
-        s3_client = None
-else:
-    logger.warning("B2 credentials not found in environment variables")
+        return None
+
+def _warm_s3_client():
+    """Build the client and make one cheap call so credentials, signer and TLS are ready"""
+    s3_client = get_s3_client()
+    if not (s3_client and B2_BUCKET_NAME):
+        return
+    try:
+        s3_client.head_bucket(Bucket=B2_BUCKET_NAME)
+        logger.info("B2 client warmed up")
+    except Exception as e:
+        logger.warning(f"B2 warm-up failed: {str(e)}")
+
+# Pay the cold-start cost at process start rather than on the first request
+threading.Thread(target=_warm_s3_client, daemon=True).start()
 
 # Ensure thumbnail cache directory exists and is empty
 cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
                           'backend', 'thumbnails_cache')
 os.makedirs(cache_dir, exist_ok=True)
 
+# File count in the cache dir, memoized briefly so the debug endpoint doesn't walk it per hit
+_cache_count_cache = TTLCache(maxsize=1, ttl=5.0)
+
+@cached(_cache_count_cache, lock=threading.Lock())
+def _cache_file_count():
+    with os.scandir(cache_dir) as it:
+        return sum(1 for entry in it if entry.is_file())
+
 # Check if server can reach B2
 def check_b2_connection():
+    s3_client = get_s3_client()
     if not s3_client:
         return False, "B2 client not initialized"
     
@@ -75,10 +112,11 @@ def clear_thumbnail_cache():
     try:
         if os.path.exists(cache_dir):
             # Remove all files in the directory but keep the directory
-            for filename in os.listdir(cache_dir):
-                file_path = os.path.join(cache_dir, filename)
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
+            with os.scandir(cache_dir) as it:
+                for entry in it:
+                    if entry.is_file():
+                        os.unlink(entry.path)
+            _cache_count_cache.clear()
         return True, f"Cleared thumbnail cache directory: {cache_dir}"
     except Exception as e:
         return False, f"Failed to clear thumbnail cache: {str(e)}"
@@ -96,8 +134,7 @@ def debug_thumbnail():
     # Check cache directory
     cache_status = f"Cache directory: {cache_dir}"
     if os.path.exists(cache_dir):
-        files = os.listdir(cache_dir)
-        cache_status += f", contains {len(files)} files"
+        cache_status += f", contains {_cache_file_count()} files"
     else:
         cache_status += " (does not exist)"
     
@@ -118,6 +155,19 @@ def debug_thumbnail():
     
     return jsonify(results)
 
+# A simple 1x1 transparent PNG, used when the placeholder file is missing
+_FALLBACK_PNG = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082')
+
+# Load the placeholder image once instead of reading it from disk per request
+_placeholder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'placeholder.png')
+try:
+    with open(_placeholder_path, 'rb') as f:
+        _PLACEHOLDER = f.read()
+except OSError:
+    logger.error(f"Placeholder image not found at: {_placeholder_path}")
+    _PLACEHOLDER = _FALLBACK_PNG
+_PLACEHOLDER_ETAG = hashlib.md5(_PLACEHOLDER).hexdigest()
+
 # Test endpoint that serves the placeholder image
 @app.route('/api/thumbnail/<song_id>', methods=['GET'])
 def test_thumbnail(song_id):
@@ -127,23 +177,27 @@ def test_thumbnail(song_id):
     """
     logger.info(f"Test thumbnail endpoint called for song ID: {song_id}")
     
-    # Return the placeholder image
-    placeholder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'placeholder.png')
-    if os.path.exists(placeholder_path):
-        logger.info(f"Returning placeholder image from {placeholder_path}")
-        return send_file(placeholder_path, mimetype='image/png')
+    # The placeholder never changes, so let clients and proxies keep it
+    if request.if_none_match.contains(_PLACEHOLDER_ETAG):
+        response = Response(status=304)
     else:
-        logger.error(f"Placeholder image not found at: {placeholder_path}")
-        # Create a simple 1x1 transparent PNG as fallback
-        data = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082')
-        response = Response(data, mimetype='image/png')
-        return response
+        response = Response(_PLACEHOLDER, mimetype='image/png')
+    response.set_etag(_PLACEHOLDER_ETAG)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 @app.after_request
 def add_cors_headers(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Range')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    
+    # Let browsers keep thumbnails and revalidate them with a 304 instead of refetching
+    if response.status_code == 200 and response.mimetype.startswith('image/'):
+        response.headers.setdefault('Cache-Control', 'public, max-age=604800, immutable')
+        if not response.direct_passthrough and response.get_etag() == (None, None):
+            response.add_etag()
+        response.make_conditional(request)
     return response
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Backfill has_thumbnail
+
+This script sets the has_thumbnail column in Supabase from the thumbnails that actually
+exist in the Backblaze B2 bucket, so /api/songs can filter in Postgres instead of probing B2.
+The bucket is listed once with ListObjectsV2 (thumbnails/XXXXXX.png, 6 digits with leading zeros).
+"""
+
+import os
+import sys
+import logging
+from dotenv import load_dotenv
+import boto3
+from botocore.client import Config
+from supabase import create_client
+
+logger = logging.getLogger(__name__)
+
+# Number of song IDs per UPDATE ... WHERE id IN (...) request
+BATCH_SIZE = 100
+
+# Rows fetched per request when paging through the songs table
+PAGE_SIZE = 1000
+
+def create_b2_client(b2_key_id, b2_app_key):
+    """S3 client for the eu-central-003 B2 endpoint"""
+    return boto3.client(
+        's3',
+        endpoint_url='https://s3.eu-central-003.backblazeb2.com',
+        aws_access_key_id=b2_key_id,
+        aws_secret_access_key=b2_app_key,
+        region_name='eu-central-003',
+        config=Config(signature_version='s3v4', s3={'addressing_style': 'path'})
+    )
+
+def list_thumbnail_ids(s3_client, bucket_name):
+    """Return the set of 6-digit thumbnail IDs in the bucket"""
+    thumbnail_ids = set()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix='thumbnails/'):
+        for obj in page.get('Contents', []):
+            # thumbnails/000500.png -> 000500
+            thumbnail_ids.add(obj['Key'][len('thumbnails/'):].rsplit('.', 1)[0])
+    return thumbnail_ids
+
+def fetch_songs(supabase, song_ids=None):
+    """Fetch id and has_thumbnail of the given songs, or of every song page by page
+    (PostgREST caps a single select at 1000 rows)"""
+    songs = []
+    if song_ids is not None:
+        song_ids = list(song_ids)
+        for i in range(0, len(song_ids), BATCH_SIZE):
+            songs.extend(supabase.table('songs').select('id', 'has_thumbnail')
+                         .in_('id', song_ids[i:i + BATCH_SIZE]).execute().data)
+        return songs
+    
+    offset = 0
+    while True:
+        page = (supabase.table('songs').select('id', 'has_thumbnail').order('id')
+                .range(offset, offset + PAGE_SIZE - 1).execute().data)
+        songs.extend(page)
+        if len(page) < PAGE_SIZE:
+            return songs
+        offset += PAGE_SIZE
+
+def backfill(supabase, s3_client, bucket_name, song_ids=None):
+    """Set has_thumbnail for the given songs (default: all songs) from the thumbnails in B2
+    
+    Returns (flagged with thumbnail, flagged without, songs checked). Listing or fetching
+    errors are raised; failed updates are logged.
+    """
+    # List all thumbnails in one sweep
+    logger.info(f"Listing thumbnails in bucket {bucket_name}...")
+    thumbnail_ids = list_thumbnail_ids(s3_client, bucket_name)
+    logger.info(f"Found {len(thumbnail_ids)} thumbnails in B2")
+
+    # Fetch song IDs from the database
+    logger.info("Fetching songs from the database...")
+    songs = fetch_songs(supabase, song_ids)
+    logger.info(f"Retrieved {len(songs)} songs from the database")
+
+    # Only touch songs whose flag actually changes
+    with_thumbnail = []
+    without_thumbnail = []
+    for song in songs:
+        has_thumbnail = song['id'].lstrip('0').zfill(6) in thumbnail_ids
+        if has_thumbnail != bool(song.get('has_thumbnail')):
+            (with_thumbnail if has_thumbnail else without_thumbnail).append(song['id'])
+
+    # Update in batches rather than one request per song
+    for value, ids in ((True, with_thumbnail), (False, without_thumbnail)):
+        for i in range(0, len(ids), BATCH_SIZE):
+            batch_ids = ids[i:i + BATCH_SIZE]
+            try:
+                supabase.table('songs').update({'has_thumbnail': value}).in_('id', batch_ids).execute()
+            except Exception as e:
+                logger.error(f"Error updating has_thumbnail for {len(batch_ids)} songs: {str(e)}")
+
+    return len(with_thumbnail), len(without_thumbnail), len(songs)
+
+def main():
+    # Configure logging here rather than at import, so upload_to_supabase.py's own
+    # logging setup still applies when it imports backfill()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    
+    # Load environment variables
+    if os.path.exists('.env'):
+        load_dotenv()
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_KEY')
+    b2_key_id = os.getenv('B2_KEY_ID')
+    b2_app_key = os.getenv('B2_APP_KEY')
+    b2_bucket_name = os.getenv('B2_BUCKET_NAME')
+
+    if not all([supabase_url, supabase_key, b2_key_id, b2_app_key, b2_bucket_name]):
+        logger.error("Missing credentials. Please add SUPABASE_URL, SUPABASE_KEY, B2_KEY_ID, B2_APP_KEY and B2_BUCKET_NAME to your .env file")
+        sys.exit(1)
+
+    supabase = create_client(supabase_url, supabase_key)
+    s3_client = create_b2_client(b2_key_id, b2_app_key)
+
+    try:
+        flagged, unflagged, total = backfill(supabase, s3_client, b2_bucket_name)
+    except Exception as e:
+        logger.error(f"Error during backfill: {str(e)}")
+        sys.exit(1)
+
+    logger.info(f"Backfill complete. Flagged {flagged} songs with thumbnail and {unflagged} without, out of {total} songs.")
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ CREATE TABLE IF NOT EXISTS public.songs (
     thumbnail_path TEXT NOT NULL,  -- Relative path in B2 (e.g., "thumbnails/0169512.png")
     storage_url TEXT NOT NULL,  -- Full B2 URL for audio
     thumbnail_url TEXT NOT NULL,  -- Full B2 URL for thumbnail
+    has_thumbnail BOOLEAN DEFAULT false,  -- Whether thumbnail_path exists in B2 (see backfill_has_thumbnail.py)
     created_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW()),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW())
 );
@@ -39,12 +40,21 @@ CREATE INDEX IF NOT EXISTS idx_songs_album ON public.songs(album);
 CREATE INDEX IF NOT EXISTS idx_songs_release_date ON public.songs(release_date);
 CREATE INDEX IF NOT EXISTS idx_songs_youtube_url ON public.songs(youtube_url);
 CREATE INDEX IF NOT EXISTS idx_songs_source_url ON public.songs(source_url);
+-- Existing databases: add the has_thumbnail column and index the list view query
+ALTER TABLE public.songs ADD COLUMN IF NOT EXISTS has_thumbnail BOOLEAN DEFAULT false;
+CREATE INDEX IF NOT EXISTS idx_songs_has_thumbnail_updated_at ON public.songs(has_thumbnail, updated_at DESC);
 CREATE INDEX IF NOT EXISTS idx_tags_name ON public.tags(name);
+-- song_tags PK is (song_id, tag_id), so tag_id lookups need their own index
+CREATE INDEX IF NOT EXISTS idx_song_tags_tag_id ON public.song_tags(tag_id);
 
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION public.update_updated_at_column()
 RETURNS TRIGGER AS $$
 BEGIN
+    -- Don't reorder songs when only has_thumbnail changes (backfill_has_thumbnail.py)
+    IF (to_jsonb(NEW) - 'has_thumbnail' - 'updated_at') = (to_jsonb(OLD) - 'has_thumbnail' - 'updated_at') THEN
+        RETURN NEW;
+    END IF;
     NEW.updated_at = TIMEZONE('utc'::text, NOW());
     RETURN NEW;
 END;
@@ -64,4 +74,94 @@ BEGIN
             EXECUTE FUNCTION public.update_updated_at_column();
     END IF;
 END
-$$; 
\ No newline at end of file
+$$;
+
+-- Query Functions ------------------------------------------------------------------
+
+-- Page of songs with a given tag, joined and filtered server-side, with the total
+-- number of matching songs on every row (called from /api/songs?tag=...)
+CREATE OR REPLACE FUNCTION public.songs_by_tag(
+    tag_name TEXT,
+    p_limit INTEGER,
+    p_offset INTEGER,
+    p_random BOOLEAN DEFAULT false,
+    p_thumbs BOOLEAN DEFAULT true
+)
+RETURNS TABLE (song JSONB, total BIGINT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT jsonb_build_object(
+               'id', s.id,
+               'title', s.title,
+               'artist', s.artist,
+               'album', s.album,
+               'duration', s.duration,
+               'updated_at', s.updated_at,
+               'has_thumbnail', s.has_thumbnail
+           ) AS song,
+           COUNT(*) OVER() AS total
+    FROM public.songs s
+    JOIN public.song_tags st ON st.song_id = s.id
+    JOIN public.tags t ON t.id = st.tag_id
+    WHERE t.name = tag_name
+      AND (NOT p_thumbs OR s.has_thumbnail)
+    ORDER BY CASE WHEN p_random THEN random() END, s.updated_at DESC, s.id
+    LIMIT p_limit OFFSET p_offset
+$$;
+
+-- Page of songs with the total number of matching songs on every row, so the
+-- song list needs a single round-trip (called from /api/songs)
+CREATE OR REPLACE FUNCTION public.songs_page(
+    p_limit INTEGER,
+    p_offset INTEGER,
+    p_random BOOLEAN DEFAULT false,
+    p_thumbs BOOLEAN DEFAULT true
+)
+RETURNS TABLE (song JSONB, total BIGINT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT jsonb_build_object(
+               'id', s.id,
+               'title', s.title,
+               'artist', s.artist,
+               'album', s.album,
+               'duration', s.duration,
+               'updated_at', s.updated_at,
+               'has_thumbnail', s.has_thumbnail
+           ) AS song,
+           COUNT(*) OVER() AS total
+    FROM public.songs s
+    WHERE (NOT p_thumbs OR s.has_thumbnail)
+    ORDER BY CASE WHEN p_random THEN random() END, s.updated_at DESC, s.id
+    LIMIT p_limit OFFSET p_offset
+$$;
+
+-- Most used tags with the number of songs carrying each one, grouped server-side
+-- (called from /api/top-tags)
+CREATE OR REPLACE FUNCTION public.top_tags(p_limit INTEGER DEFAULT 15)
+RETURNS TABLE (name TEXT, count BIGINT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT t.name, COUNT(*) AS count
+    FROM public.song_tags st
+    JOIN public.tags t ON t.id = st.tag_id
+    GROUP BY t.name
+    ORDER BY count DESC, t.name
+    LIMIT p_limit
+$$;
+
+-- Set thumbnail_path for many songs in one statement; p_ids[i] gets p_paths[i]
+-- (called from update_thumbnail_paths.py)
+CREATE OR REPLACE FUNCTION public.set_thumbnail_paths(p_ids TEXT[], p_paths TEXT[])
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE public.songs s
+        SET thumbnail_path = u.path
+        FROM unnest(p_ids, p_paths) AS u(id, path)
+        WHERE s.id = u.id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated
+$$;
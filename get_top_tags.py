@@ -1,84 +1,109 @@
 import os
+import logging
 from dotenv import load_dotenv
 from supabase import create_client
 from collections import Counter, defaultdict
+from functools import lru_cache
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+# Per-row diagnostics are logged at DEBUG; set LOGLEVEL=DEBUG to see them
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv('LOGLEVEL', 'INFO'))
 
-def get_top_tags(limit=15):
-    """Analyze tags and their usage across songs.
+@lru_cache(maxsize=1)
+def _default_client():
+    """Supabase client for when no client is passed in, created on first use so
+    importing this module (as backend/app.py does) never needs SUPABASE_KEY"""
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+
+def get_top_tags(limit=15, client=None):
+    """Get the most used tags, counted in Postgres by the top_tags RPC.
     
     Args:
         limit (int): Number of top tags to return (default: 15)
+        client: Supabase client to query with (default: this module's client)
+    
+    Returns:
+        list: (tag name, song count) tuples, most used first
+    """
+    db = client or _default_client()
+    rows = db.rpc('top_tags', {'p_limit': limit}).execute().data
+    return [(row['name'], row['count']) for row in rows]
+
+# Rows per request when paging through whole tables
+PAGE_SIZE = 1000
+
+def _pages(db, table, columns, order, page_size=PAGE_SIZE):
+    """Yield every row of a table, fetched page by page with .range()
+    
+    order is a list of columns giving a stable order, so pages don't overlap.
     """
-    print(f"Starting tag analysis with limit {limit}...")
+    offset = 0
+    while True:
+        query = db.table(table).select(columns)
+        for column in order:
+            query = query.order(column)
+        rows = query.range(offset, offset + page_size - 1).execute().data
+        yield from rows
+        if len(rows) < page_size:
+            break
+        offset += page_size
+
+def analyze_tags(limit=15, client=None):
+    """Analyze tags and their usage across songs.
     
-    # Get all songs with their titles
-    songs_response = supabase.table('songs').select('id, title, artist').execute()
-    songs = songs_response.data
-    total_songs = len(songs)
-    print(f"\nTotal songs in database: {total_songs}")
+    Args:
+        limit (int): Number of top tags to return (default: 15)
+        client: Supabase client to query with (default: this module's client)
+    """
+    db = client or _default_client()
+    logger.info(f"Starting tag analysis with limit {limit}...")
     
-    # Create a mapping of song IDs to their info
-    song_info = {song['id']: song for song in songs}
+    # Only the number of songs is needed here; titles come embedded in song_tags below
+    total_songs = db.table('songs').select('id', count='exact').limit(1).execute().count or 0
+    logger.info(f"Total songs in database: {total_songs}")
     
     # Get all tags with their names
-    tags_response = supabase.table('tags').select('id, name').execute()
+    tags_response = db.table('tags').select('id, name').execute()
     tags = tags_response.data
-    print(f"Total unique tags: {len(tags)}")
-    print("\nFirst few tags in database:")
-    for tag in tags[:5]:
-        print(f"Tag ID: {tag['id']}, Name: {tag['name']}")
+    logger.info(f"Total unique tags: {len(tags)}")
+    logger.debug("First few tags in database:\n%s",
+                 "\n".join(f"Tag ID: {tag['id']}, Name: {tag['name']}" for tag in tags[:5]))
     
     # Get all song-tag relationships with a join to get tag names directly
-    print("\nFetching song-tag relationships...")
-    song_tags_response = supabase.from_('song_tags') \
-        .select('song_id, tags(id, name)') \
-        .execute()
-    
-    song_tags = song_tags_response.data
-    print(f"Total tag assignments: {len(song_tags)}")
-    print("\nFirst few song-tag relationships:")
-    for relation in song_tags[:5]:
-        print(f"Song ID: {relation['song_id']}, Tag: {relation.get('tags', {}).get('name', 'N/A')}")
-    
-    # Group tags by song
+    logger.info("Fetching song-tag relationships...")
+    
+    # Group tags by song as the pages arrive, keeping the embedded title/artist of tagged songs
     song_to_tags = defaultdict(list)
-    for relation in song_tags:
+    song_info = {}
+    total_assignments = 0
+    for relation in _pages(db, 'song_tags', 'song_id, songs(title, artist), tags(id, name)', ['song_id', 'tag_id']):
+        if relation.get('songs'):
+            song_info[relation['song_id']] = relation['songs']
+        if total_assignments < 5:
+            logger.debug(f"Song ID: {relation['song_id']}, Tag: {relation.get('tags', {}).get('name', 'N/A')}")
+        total_assignments += 1
         if relation.get('tags') and relation['tags'].get('name'):
             song_id = relation['song_id']
             tag_name = relation['tags']['name']
             song_to_tags[song_id].append(tag_name)
+    logger.info(f"Total tag assignments: {total_assignments}")
     
     # Find songs with multiple tags
     multi_tag_songs = {song_id: tags for song_id, tags in song_to_tags.items() if len(tags) > 1}
-    print(f"\nFound {len(multi_tag_songs)} songs with multiple tags")
-    
-    # Count tag usage
-    tag_counts = Counter()
-    songs_with_tags = set()
+    logger.info(f"Found {len(multi_tag_songs)} songs with multiple tags")
     
-    for song_id, tags in song_to_tags.items():
-        for tag in tags:
-            tag_counts[tag] += 1
-        songs_with_tags.add(song_id)
+    # Count tag usage in one pass
+    tag_counts = Counter(tag for tags in song_to_tags.values() for tag in tags)
     
     # Calculate statistics
-    songs_with_tags_count = len(songs_with_tags)
-    tags_per_song = len(song_tags) / total_songs if total_songs > 0 else 0
-    
-    print(f"\nSongs with at least one tag: {songs_with_tags_count} ({(songs_with_tags_count/total_songs*100):.1f}%)")
-    print(f"Average tags per song: {tags_per_song:.1f}")
+    songs_with_tags_count = len(song_to_tags)
+    tags_per_song = total_assignments / total_songs if total_songs > 0 else 0
     
-    # Print example songs with their tags
-    print("\nExample songs with tags:")
+    logger.info(f"Songs with at least one tag: {songs_with_tags_count} ({(songs_with_tags_count/total_songs*100):.1f}%)")
+    logger.info(f"Average tags per song: {tags_per_song:.1f}")
     
     # Find a song with exactly one tag
     one_tag_example = None
@@ -89,26 +114,21 @@ def get_top_tags(limit=15):
     
     if one_tag_example:
         song_id, song, tags = one_tag_example
-        print(f"\nSong with one tag:")
-        print(f"Title: {song['title']}")
-        print(f"Artist: {song['artist']}")
-        print(f"Tag: {tags[0]}")
-    
-    # Print all songs with multiple tags
-    print("\nAll songs with multiple tags:")
-    for song_id, tags in multi_tag_songs.items():
-        if song_id in song_info:
-            song = song_info[song_id]
-            print(f"\nTitle: {song['title']}")
-            print(f"Artist: {song['artist']}")
-            print(f"Tags: {', '.join(tags)}")
-    
-    # Get and print top tags based on limit
-    print(f"\nTop {limit} most used tags:")
-    for tag_name, count in tag_counts.most_common(limit):
-        print(f"{tag_name}: {count} songs")
-    
-    return tag_counts.most_common(limit)
+        logger.debug(f"Song with one tag: {song['title']} by {song['artist']} ({tags[0]})")
+    
+    # Log all songs with multiple tags as one message
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("All songs with multiple tags:\n%s", "\n".join(
+            f"{song_info[song_id]['title']} by {song_info[song_id]['artist']}: {', '.join(tags)}"
+            for song_id, tags in multi_tag_songs.items() if song_id in song_info
+        ))
+    
+    # Log top tags based on limit
+    top_tags = tag_counts.most_common(limit)
+    logger.info(f"Top {limit} most used tags:\n" + "\n".join(f"{tag_name}: {count} songs" for tag_name, count in top_tags))
+    
+    return top_tags
 
 if __name__ == "__main__":
-    get_top_tags(15) 
\ No newline at end of file
+    logging.basicConfig(format='%(message)s')
+    analyze_tags(15) 
\ No newline at end of file
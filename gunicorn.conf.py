@@ -0,0 +1,13 @@
+# Gunicorn settings, picked up automatically when running `gunicorn main:app`
+# from the project root (see Procfile)
+import os
+import multiprocessing
+
+# Streaming audio and fetching thumbnails spend most of their time waiting on B2,
+# so use threaded workers instead of sync ones that block a whole process per request
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', (2 * multiprocessing.cpu_count()) + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+# Keep browser connections open between thumbnail and API requests
+keepalive = 65
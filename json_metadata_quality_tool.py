@@ -1,19 +1,138 @@
 #!/usr/bin/env python3
 import os
-import json
+import mmap
+import orjson
 import sys
 import argparse
-from collections import Counter, OrderedDict
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 from datetime import datetime
 import shutil
 import uuid
 
+# Files larger than this are memory-mapped instead of read into a bytes copy
+MMAP_THRESHOLD = 64 * 1024
+
+def _load_json(path):
+    """Read and parse a JSON file with orjson"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= MMAP_THRESHOLD:
+            return orjson.loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
+def _dump_json(path, data, pretty=False):
+    """Write data as UTF-8 JSON with orjson, compact unless pretty is set"""
+    # Write a new file and swap it in, so a hard-linked backup keeps the old content
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        f.write(orjson.dumps(data, option=option))
+    os.replace(tmp_path, path)
+
+def _backup(path):
+    """Keep the current content of path as path.bak, without overwriting an existing backup"""
+    backup_path = f"{path}.bak"
+    try:
+        # A hard link costs no extra writes; _dump_json replaces the file rather than rewriting it
+        os.link(path, backup_path)
+    except FileExistsError:
+        pass
+    except OSError:
+        # Filesystem without hard links
+        if not os.path.exists(backup_path):
+            shutil.copy2(path, backup_path)
+
+def _read_keys(path):
+    """Return the set of top-level keys of a JSON file, or None if the root is not an object"""
+    data = _load_json(path)
+    if not isinstance(data, dict):
+        return None
+    return set(data)
+
+# Files handed to each worker process at a time, to amortize pickling
+CHUNKSIZE = 64
+
+# The fix passes mostly wait on reads and writes, so run more workers than cores
+# to keep several file operations in flight per core
+FIX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def _scan_one(path):
+    """Worker: return (keys, error) for one file; keys is None on error"""
+    try:
+        keys = _read_keys(path)
+    except Exception as e:
+        return None, str(e)
+    if keys is None:
+        return None, "Root is not a dictionary"
+    return keys, None
+
+def _order_keys(data, standard_keys, keep_extra):
+    """Return data with standard keys first, optionally followed by any other keys"""
+    ordered_data = {key: data[key] for key in standard_keys if key in data}
+    if keep_extra:
+        ordered_data.update((key, value) for key, value in data.items() if key not in ordered_data)
+    return ordered_data
+
+def _fix_one(args):
+    """Worker: copy missing keys from the original file; return (keys, error)"""
+    new_file_path, original_file_path, missing_keys, standard_keys, pretty = args
+    try:
+        # Read new file
+        new_data = _load_json(new_file_path)
+        
+        # Read original file
+        original_data = _load_json(original_file_path)
+        
+        # Copy missing keys from original
+        copied = [key for key in missing_keys if key in original_data]
+        if not copied:
+            # The original doesn't have them either; leave the file untouched
+            return set(new_data), None
+        for key in copied:
+            new_data[key] = original_data[key]
+        
+        # Create backup
+        _backup(new_file_path)
+        
+        # Reorder keys to match standard format, keeping any non-standard keys
+        ordered_data = _order_keys(new_data, standard_keys, keep_extra=True)
+        
+        # Save the updated file
+        _dump_json(new_file_path, ordered_data, pretty)
+        return set(ordered_data), None
+    except Exception as e:
+        return None, str(e)
+
+def _remove_one(args):
+    """Worker: keep only the standard keys in a file; return (keys, error)"""
+    file_path, standard_keys, pretty = args
+    try:
+        # Read file
+        data = _load_json(file_path)
+        
+        # Keep only the standard keys; skip the backup and rewrite if nothing changes
+        ordered_data = _order_keys(data, standard_keys, keep_extra=False)
+        if list(ordered_data) == list(data):
+            return set(ordered_data), None
+        
+        # Create backup
+        _backup(file_path)
+        
+        # Save the file with only the standard keys
+        _dump_json(file_path, ordered_data, pretty)
+        return set(ordered_data), None
+    except Exception as e:
+        return None, str(e)
+
 class JsonMetadataQualityTool:
     """
     A comprehensive tool for analyzing and fixing JSON metadata quality.
     """
     
-    def __init__(self, new_dir, original_dir=None, verbose=False, auto_fix=False):
+    def __init__(self, new_dir, original_dir=None, verbose=False, auto_fix=False, pretty=False):
         """
         Initialize the JSON metadata quality tool.
         
@@ -22,17 +141,20 @@ class JsonMetadataQualityTool:
             original_dir: Optional directory with original metadata files for reference
             verbose: Whether to print detailed information
             auto_fix: Whether to automatically fix issues without prompting
+            pretty: Whether to indent fixed files instead of writing compact JSON
         """
         self.new_dir = new_dir
         self.original_dir = original_dir
         self.verbose = verbose
         self.auto_fix = auto_fix
+        self.pretty = pretty
         
         # Initialize tracking variables
         self.json_files = []
         self.total_files = 0
         self.key_counter = Counter()
         self.file_keys = {}
+        self.schemas = {}
         self.common_keys = []
         self.files_with_missing_keys = {}
         self.files_with_unusual_keys = {}
@@ -45,6 +167,8 @@ class JsonMetadataQualityTool:
             'thumbnail_url', 'audio_url', 'created_at', 'local_paths',
             'source_id', 'source_url'
         ]
+        self.standard_key_set = frozenset(self.standard_keys)
+        self.common_key_set = frozenset()
     
     def run(self):
         """
@@ -92,7 +216,8 @@ class JsonMetadataQualityTool:
             print(f"Error: Directory '{self.new_dir}' does not exist.")
             return
         
-        self.json_files = [f for f in os.listdir(self.new_dir) if f.endswith('.json')]
+        with os.scandir(self.new_dir) as it:
+            self.json_files = [entry.name for entry in it if entry.name.endswith('.json') and entry.is_file()]
         self.total_files = len(self.json_files)
         
         if self.total_files == 0:
@@ -111,31 +236,24 @@ class JsonMetadataQualityTool:
         """
         print("\nAnalyzing JSON schema...")
         
-        for i, filename in enumerate(self.json_files):
-            if (i + 1) % 500 == 0 or i + 1 == self.total_files:
-                print(f"Processing file {i + 1}/{self.total_files}...")
-            
-            file_path = os.path.join(self.new_dir, filename)
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+        # Files are independent, so parse them across all cores
+        new_prefix = os.path.join(self.new_dir, '')  # join once, then plain concatenation
+        paths = [new_prefix + filename for filename in self.json_files]
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = executor.map(_scan_one, paths, chunksize=CHUNKSIZE)
+            for i, (filename, (keys, error)) in enumerate(zip(self.json_files, results)):
+                if (i + 1) % 500 == 0 or i + 1 == self.total_files:
+                    print(f"Processing file {i + 1}/{self.total_files}...")
                 
-                if not isinstance(data, dict):
-                    self.errors.append((filename, "Root is not a dictionary"))
+                if error:
+                    self.errors.append((filename, error))
+                    if self.verbose:
+                        print(f"Error processing {filename}: {error}")
                     continue
                 
-                # Extract keys
-                keys = set(data.keys())
-                self.file_keys[filename] = keys
-                
-                # Update counter
-                self.key_counter.update(keys)
-            
-            except Exception as e:
-                self.errors.append((filename, str(e)))
-                if self.verbose:
-                    print(f"Error processing {filename}: {e}")
+                self.file_keys[filename] = self._intern_schema(keys)
+        
+        self.key_counter = self._count_keys()
         
         # Determine common keys (present in >90% of files)
         threshold = self.total_files * 0.9
@@ -144,20 +262,54 @@ class JsonMetadataQualityTool:
         
         # Sort common keys by frequency
         self.common_keys.sort(key=lambda k: (-self.key_counter[k], k))
+        self.common_key_set = frozenset(self.common_keys)
         
         print(f"Identified {len(self.key_counter)} unique keys across all files.")
         print(f"Found {len(self.common_keys)} common keys (present in >90% of files).")
     
+    def _intern_schema(self, keys):
+        """
+        Return the shared frozenset for this key layout.
+        
+        Most files use one of a handful of layouts, so files with the same keys
+        share one object and the set math below runs once per layout.
+        """
+        schema = frozenset(sys.intern(key) for key in keys)
+        return self.schemas.setdefault(schema, schema)
+    
+    def _count_keys(self):
+        """
+        Count in how many files each key appears, one layout at a time.
+        """
+        key_counter = Counter()
+        for schema, file_count in Counter(self.file_keys.values()).items():
+            for key in schema:
+                key_counter[key] += file_count
+        return key_counter
+    
+    def _find_missing_keys(self):
+        """
+        Map each file missing common keys to the keys it is missing.
+        """
+        missing_by_schema = {schema: self.common_key_set - schema for schema in self.schemas}
+        return {filename: missing_by_schema[keys] for filename, keys in self.file_keys.items()
+                if missing_by_schema[keys]}
+    
+    def _find_unusual_keys(self):
+        """
+        Map each file with non-standard keys to those keys.
+        """
+        unusual_by_schema = {schema: schema - self.standard_key_set for schema in self.schemas}
+        return {filename: unusual_by_schema[keys] for filename, keys in self.file_keys.items()
+                if unusual_by_schema[keys]}
+    
     def _identify_files_with_missing_keys(self):
         """
         Identify files with missing common keys.
         """
         print("\nIdentifying files with missing common keys...")
         
-        for filename, keys in self.file_keys.items():
-            missing_keys = set(self.common_keys) - keys
-            if missing_keys:
-                self.files_with_missing_keys[filename] = missing_keys
+        self.files_with_missing_keys = self._find_missing_keys()
         
         print(f"Found {len(self.files_with_missing_keys)} files with missing common keys.")
         
@@ -175,10 +327,7 @@ class JsonMetadataQualityTool:
         """
         print("\nIdentifying files with unusual keys...")
         
-        for filename, keys in self.file_keys.items():
-            unusual_keys = keys - set(self.standard_keys)
-            if unusual_keys:
-                self.files_with_unusual_keys[filename] = unusual_keys
+        self.files_with_unusual_keys = self._find_unusual_keys()
         
         print(f"Found {len(self.files_with_unusual_keys)} files with unusual keys.")
         
@@ -213,7 +362,7 @@ class JsonMetadataQualityTool:
             print(f"  {key}: {count} files ({count/self.total_files*100:.1f}%)")
         
         # Display non-standard keys that were found
-        non_standard_keys = set(self.key_counter.keys()) - set(self.standard_keys)
+        non_standard_keys = set(self.key_counter.keys()) - self.standard_key_set
         if non_standard_keys:
             print("\nNon-standard keys found:")
             for key in sorted(non_standard_keys):
@@ -249,59 +398,36 @@ class JsonMetadataQualityTool:
         fixed_count = 0
         failed_count = 0
         
-        for i, (filename, missing_keys) in enumerate(self.files_with_missing_keys.items()):
-            if (i + 1) % 100 == 0 or i + 1 == len(self.files_with_missing_keys):
-                print(f"Fixing file {i + 1}/{len(self.files_with_missing_keys)}...")
-            
-            new_file_path = os.path.join(self.new_dir, filename)
-            original_file_path = os.path.join(self.original_dir, filename)
-            
-            try:
-                # Read new file
-                with open(new_file_path, 'r', encoding='utf-8') as f:
-                    new_data = json.load(f)
+        # Files without an original can't be fixed; the rest are fixed across all cores.
+        # One readdir of the original directory replaces a stat per file.
+        original_files = set(os.listdir(self.original_dir))
+        new_prefix = os.path.join(self.new_dir, '')
+        original_prefix = os.path.join(self.original_dir, '')
+        jobs = []
+        for filename, missing_keys in self.files_with_missing_keys.items():
+            if filename in original_files:
+                jobs.append((filename, (new_prefix + filename,
+                                        original_prefix + filename,
+                                        missing_keys, self.standard_keys, self.pretty)))
+            else:
+                if self.verbose:
+                    print(f"Warning: Original file not found for {filename}")
+                failed_count += 1
+        
+        with ProcessPoolExecutor(max_workers=FIX_WORKERS) as executor:
+            results = executor.map(_fix_one, [args for _, args in jobs], chunksize=CHUNKSIZE)
+            for i, ((filename, _), (keys, error)) in enumerate(zip(jobs, results)):
+                if (i + 1) % 100 == 0 or i + 1 == len(jobs):
+                    print(f"Fixing file {i + 1}/{len(jobs)}...")
                 
-                # If original file exists
-                if os.path.exists(original_file_path):
-                    # Create backup
-                    backup_path = f"{new_file_path}.bak"
-                    with open(backup_path, 'w', encoding='utf-8') as f:
-                        json.dump(new_data, f, indent=2, ensure_ascii=False)
-                    
-                    # Read original file
-                    with open(original_file_path, 'r', encoding='utf-8') as f:
-                        original_data = json.load(f)
-                    
-                    # Copy missing keys from original
-                    for key in missing_keys:
-                        if key in original_data:
-                            new_data[key] = original_data[key]
-                    
-                    # Reorder keys to match standard format
-                    ordered_data = OrderedDict()
-                    for key in self.standard_keys:
-                        if key in new_data:
-                            ordered_data[key] = new_data[key]
-                    
-                    # Add any non-standard keys
-                    for key in new_data:
-                        if key not in ordered_data:
-                            ordered_data[key] = new_data[key]
-                    
-                    # Save the updated file
-                    with open(new_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(ordered_data, f, indent=2, ensure_ascii=False)
-                    
+                if keys is not None:
+                    # Track the keys as written so verification doesn't have to re-read the file
+                    self.file_keys[filename] = self._intern_schema(keys)
                     fixed_count += 1
                 else:
                     if self.verbose:
-                        print(f"Warning: Original file not found for {filename}")
+                        print(f"Error fixing {filename}: {error}")
                     failed_count += 1
-            
-            except Exception as e:
-                if self.verbose:
-                    print(f"Error fixing {filename}: {e}")
-                failed_count += 1
         
         print(f"Fixed {fixed_count} files with missing keys.")
         if failed_count > 0:
@@ -317,43 +443,26 @@ class JsonMetadataQualityTool:
         failed_count = 0
         unusual_keys_removed = 0
         
-        for i, (filename, unusual_keys) in enumerate(self.files_with_unusual_keys.items()):
-            if (i + 1) % 100 == 0 or i + 1 == len(self.files_with_unusual_keys):
-                print(f"Processing file {i + 1}/{len(self.files_with_unusual_keys)}...")
-            
-            file_path = os.path.join(self.new_dir, filename)
-            
-            try:
-                # Read file
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Create backup
-                backup_path = f"{file_path}.bak"
-                if not os.path.exists(backup_path):  # Don't overwrite existing backup
-                    with open(backup_path, 'w', encoding='utf-8') as f:
-                        json.dump(data, f, indent=2, ensure_ascii=False)
-                
-                # Create a new ordered dictionary with only the standard keys
-                ordered_data = OrderedDict()
-                for key in self.standard_keys:
-                    if key in data:
-                        ordered_data[key] = data[key]
-                
-                # Save the modified file
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(ordered_data, f, indent=2, ensure_ascii=False)
+        new_prefix = os.path.join(self.new_dir, '')
+        jobs = [(new_prefix + filename, self.standard_keys, self.pretty)
+                for filename in self.files_with_unusual_keys]
+        with ProcessPoolExecutor(max_workers=FIX_WORKERS) as executor:
+            results = executor.map(_remove_one, jobs, chunksize=CHUNKSIZE)
+            for i, ((filename, unusual_keys), (keys, error)) in enumerate(zip(self.files_with_unusual_keys.items(), results)):
+                if (i + 1) % 100 == 0 or i + 1 == len(self.files_with_unusual_keys):
+                    print(f"Processing file {i + 1}/{len(self.files_with_unusual_keys)}...")
                 
-                fixed_count += 1
-                unusual_keys_removed += len(unusual_keys)
-                
-                if self.verbose:
-                    print(f"Removed {len(unusual_keys)} unusual keys from {filename}")
-            
-            except Exception as e:
-                if self.verbose:
-                    print(f"Error processing {filename}: {e}")
-                failed_count += 1
+                if keys is not None:
+                    self.file_keys[filename] = self._intern_schema(keys)
+                    fixed_count += 1
+                    unusual_keys_removed += len(unusual_keys)
+                    
+                    if self.verbose:
+                        print(f"Removed {len(unusual_keys)} unusual keys from {filename}")
+                else:
+                    if self.verbose:
+                        print(f"Error processing {filename}: {error}")
+                    failed_count += 1
         
         print(f"Removed {unusual_keys_removed} unusual keys from {fixed_count} files.")
         if failed_count > 0:
@@ -365,38 +474,11 @@ class JsonMetadataQualityTool:
         """
         print("\nVerifying fixes...")
         
-        # Reset counters and data
-        self.key_counter = Counter()
-        self.file_keys = {}
-        self.files_with_missing_keys = {}
-        self.files_with_unusual_keys = {}
-        
-        # Re-analyze files
-        for filename in self.json_files:
-            file_path = os.path.join(self.new_dir, filename)
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                keys = set(data.keys())
-                self.file_keys[filename] = keys
-                self.key_counter.update(keys)
-            
-            except Exception:
-                continue  # Skip files with errors
-        
-        # Check for missing keys
-        for filename, keys in self.file_keys.items():
-            missing_keys = set(self.common_keys) - keys
-            if missing_keys:
-                self.files_with_missing_keys[filename] = missing_keys
-        
-        # Check for unusual keys
-        for filename, keys in self.file_keys.items():
-            unusual_keys = keys - set(self.standard_keys)
-            if unusual_keys:
-                self.files_with_unusual_keys[filename] = unusual_keys
+        # The fix steps keep file_keys up to date with what they wrote, so
+        # recompute the results from it instead of re-reading every file
+        self.key_counter = self._count_keys()
+        self.files_with_missing_keys = self._find_missing_keys()
+        self.files_with_unusual_keys = self._find_unusual_keys()
         
         compliant_files = self.total_files - len(self.files_with_missing_keys) - len(self.files_with_unusual_keys)
         print(f"\nAfter fixes:")
@@ -430,7 +512,8 @@ class JsonMetadataQualityTool:
             
             f.write("ALL KEYS (by frequency):\n")
             f.write("-"*50 + "\n")
-            for key, count in sorted(self.key_counter.items(), key=lambda x: (-x[1], x[0])):
+            # Sort by name, then stably by count descending, with C-level itemgetter keys
+            for key, count in sorted(sorted(self.key_counter.items()), key=itemgetter(1), reverse=True):
                 f.write(f"{key}: {count} files ({count/self.total_files*100:.1f}%)\n")
             
             f.write("\nCOMMON KEYS (>90% of files):\n")
@@ -478,6 +561,9 @@ def main():
     parser.add_argument("--auto-fix", "-a", action="store_true",
                         help="Automatically fix issues without prompting")
     
+    parser.add_argument("--pretty", "-p", action="store_true",
+                        help="Write fixed files with 2-space indentation instead of compact JSON")
+    
     parser.add_argument("--report", "-r", action="store_true",
                         help="Generate a detailed report")
     
@@ -488,7 +574,8 @@ def main():
         new_dir=args.new_dir,
         original_dir=args.original_dir,
         verbose=args.verbose,
-        auto_fix=args.auto_fix
+        auto_fix=args.auto_fix,
+        pretty=args.pretty
     )
     
     tool.run()
@@ -1,8 +1,24 @@
 from backend.app import app, frontend_logger
 import os
+import time
 import logging
 from logging.handlers import RotatingFileHandler
 
+class CachedTimeFormatter(logging.Formatter):
+    """Formatter that runs strftime once per second instead of once per record"""
+    # (second, formatted time), swapped as one tuple so threads never see a mismatched pair
+    _cached = (None, None)
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        cached_second, cached_time = self._cached
+        if second != cached_second:
+            cached_time = time.strftime(self.default_time_format, self.converter(second))
+            self._cached = (second, cached_time)
+        return self.default_msec_format % (cached_time, record.msecs)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     
@@ -24,9 +40,9 @@ if __name__ == '__main__':
             f.write('=== New Application Run ===\n')
         
         # Set up a file handler for backend logs
-        backend_file_handler = RotatingFileHandler(backend_log_file, maxBytes=10485760, backupCount=1)
+        backend_file_handler = RotatingFileHandler(backend_log_file, maxBytes=10485760, backupCount=1, delay=True)
         backend_file_handler.setLevel(logging.DEBUG)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        formatter = CachedTimeFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         backend_file_handler.setFormatter(formatter)
         
         # Add the file handler to the root logger
@@ -45,9 +61,9 @@ if __name__ == '__main__':
             f.write('=== New Frontend Log ===\n')
         
         # Set up a file handler for frontend logs
-        frontend_file_handler = RotatingFileHandler(frontend_log_file, maxBytes=10485760, backupCount=1)
+        frontend_file_handler = RotatingFileHandler(frontend_log_file, maxBytes=10485760, backupCount=1, delay=True)
         frontend_file_handler.setLevel(logging.DEBUG)
-        frontend_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        frontend_formatter = CachedTimeFormatter('%(asctime)s - %(levelname)s - %(message)s')
         frontend_file_handler.setFormatter(frontend_formatter)
         
         # Add the file handler to the frontend logger
@@ -6,25 +6,20 @@ without needing to run the full application.
 
 import os
 import sys
+from functools import lru_cache
 
+_THUMB_FMT = "thumbnails/{}.png".format
+
+@lru_cache(maxsize=8192)
 def format_thumbnail_path(song_id):
     """
     Format the song_id to match B2 storage format using the same logic as the app.py file.
     Tests the transformation from 7-digit IDs to 6-digit IDs for B2 path access.
-    """
-    # Format the song_id to match B2 storage format (6 digits, remove first zero from 7-digit ID)
-    if len(song_id) == 7 and song_id.startswith('0'):
-        formatted_id = song_id[1:]  # Remove the first zero for 7-digit IDs
-        print(f"Formatted song ID from {song_id} to {formatted_id} for B2 path")
-    else:
-        formatted_id = song_id
-        print(f"Using original song ID format: {formatted_id}")
     
-    # Generate the thumbnail path
-    thumbnail_path = f"thumbnails/{formatted_id}.png"
-    print(f"Final thumbnail path: {thumbnail_path}")
-    
-    return thumbnail_path
+    Hot path: keep it free of prints/logging, callers report the result.
+    """
+    # 6 digits in B2: drop the first zero of a 7-digit ID (the bool slices off 0 or 1 chars)
+    return _THUMB_FMT(song_id[song_id[:1] == '0' and len(song_id) == 7:])
 
 def main():
     # Test with a variety of song IDs from the screenshot
@@ -40,6 +35,7 @@ def main():
     
     for song_id in test_ids:
         path = format_thumbnail_path(song_id)
+        print(f"{song_id} -> {path}")
         print("-" * 50)
     
     # Also test with some edge cases
@@ -56,6 +52,7 @@ def main():
     
     for song_id in edge_cases:
         path = format_thumbnail_path(song_id)
+        print(f"{song_id} -> {path}")
         print("-" * 50)
 
 if __name__ == "__main__":
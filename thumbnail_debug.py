@@ -5,8 +5,9 @@ This script creates a minimal Flask app to handle thumbnail requests.
 """
 
 import os
+import hashlib
 import sys
-from flask import Flask, send_file, Response, jsonify
+from flask import Flask, send_file, Response, jsonify, request
 import logging
 import datetime
 
@@ -17,9 +18,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# A simple 1x1 transparent PNG, decoded once
+_FALLBACK_PNG = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082')
+
 # Create a minimal Flask app
 app = Flask(__name__)
 
+# Behind nginx/Apache, let the web server send the placeholder itself via X-Sendfile
+# (nginx: an `internal; alias /path/to/static/;` location for /static/)
+app.use_x_sendfile = os.getenv('USE_X_SENDFILE') == 'True'
+
 # Ensure static directory exists
 os.makedirs(os.path.join(app.root_path, 'static'), exist_ok=True)
 
@@ -36,11 +44,20 @@ if not os.path.exists(placeholder_path):
         except ImportError:
             # If PIL is not available, create a simple 1x1 PNG
             with open(placeholder_path, 'wb') as f:
-                f.write(bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082'))
+                f.write(_FALLBACK_PNG)
                 print(f"Created 1x1 placeholder image at {placeholder_path}")
     except Exception as e:
         print(f"Could not create placeholder image: {e}")
 
+# Keep the placeholder in memory so requests don't stat and open it each time
+if os.path.exists(placeholder_path):
+    with open(placeholder_path, 'rb') as f:
+        _PLACEHOLDER_BYTES = f.read()
+else:
+    logger.error(f"Placeholder image not found at: {placeholder_path}")
+    _PLACEHOLDER_BYTES = _FALLBACK_PNG
+_PLACEHOLDER_ETAG = hashlib.md5(_PLACEHOLDER_BYTES).hexdigest()
+
 @app.route('/api/thumbnail/<song_id>', methods=['GET'])
 def api_get_thumbnail(song_id):
     """
@@ -49,23 +66,26 @@ def api_get_thumbnail(song_id):
     try:
         logger.info(f"Thumbnail endpoint called for song ID: {song_id}")
         
-        # Return the placeholder image
-        if os.path.exists(placeholder_path):
-            logger.info(f"Returning placeholder image from {placeholder_path}")
-            return send_file(placeholder_path, mimetype='image/png')
-        else:
-            logger.error(f"Placeholder image not found at: {placeholder_path}")
-            # Create a simple 1x1 transparent PNG
-            data = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082')
-            response = Response(data, mimetype='image/png')
+        # With X-Sendfile the web server reads the file; send_file handles the 304s
+        if app.use_x_sendfile and os.path.exists(placeholder_path):
+            response = send_file(placeholder_path, mimetype='image/png',
+                                 conditional=True, max_age=31536000)
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
             return response
+        
+        # Return the placeholder image; it never changes, so let browsers keep it
+        if request.if_none_match.contains(_PLACEHOLDER_ETAG):
+            response = Response(status=304)
+        else:
+            response = Response(_PLACEHOLDER_BYTES, mimetype='image/png')
+        response.set_etag(_PLACEHOLDER_ETAG)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
             
     except Exception as e:
         logger.error(f"Error in thumbnail endpoint: {str(e)}")
-        # Generate a 1x1 transparent PNG image as fallback
-        data = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082')
-        response = Response(data, mimetype='image/png')
-        return response
+        # Return a 1x1 transparent PNG image as fallback
+        return Response(_FALLBACK_PNG, mimetype='image/png')
 
 @app.route('/api/debug/thumbnail-test', methods=['GET'])
 def debug_thumbnail():
@@ -96,8 +116,7 @@ def debug_thumbnail():
     
     # Test 2: Check if we can create a Response object
     try:
-        data = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c636060606000000005ffff0b290000000049454e44ae426082')
-        test_response = Response(data, mimetype='image/png')
+        test_response = Response(_FALLBACK_PNG, mimetype='image/png')
         add_test_result(
             "Response Object Creation", 
             True,
@@ -166,6 +185,13 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    
+    # Any other image gets an ETag and a 304 on a matching If-None-Match
+    if response.status_code == 200 and response.mimetype.startswith('image/'):
+        response.headers.setdefault('Cache-Control', 'public, max-age=86400')
+        if not response.direct_passthrough and response.get_etag() == (None, None):
+            response.add_etag()
+        response.make_conditional(request)
     return response
 
 if __name__ == '__main__':
@@ -9,14 +9,16 @@ they can be downloaded successfully. It also checks for caching issues.
 import os
 import sys
 import argparse
+import shutil
 import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import boto3
 from botocore.client import Config
-import requests
 import time
 import random
-import json
+import orjson
 from datetime import datetime
 from supabase import create_client, Client
 
@@ -25,6 +27,12 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('thumbnail_tester')
 
+# Concurrent thumbnail downloads
+MAX_WORKERS = 32
+
+# Read .env once no matter how many clients are set up
+_load_env = lru_cache(maxsize=1)(load_dotenv)
+
 def setup_argparse():
     parser = argparse.ArgumentParser(description='Test thumbnail loading from B2')
     parser.add_argument('--limit', type=int, default=10, help='Number of songs to test')
@@ -36,9 +44,10 @@ def setup_argparse():
     parser.add_argument('--song-ids', type=str, help='Comma-separated list of song IDs to test')
     return parser.parse_args()
 
+@lru_cache(maxsize=1)
 def setup_b2_client():
     # Load environment variables
-    load_dotenv()
+    _load_env()
     
     # B2 configuration
     B2_KEY_ID = os.getenv('B2_KEY_ID')
@@ -56,7 +65,8 @@ def setup_b2_client():
             endpoint_url='https://s3.us-west-004.backblazeb2.com',
             aws_access_key_id=B2_KEY_ID,
             aws_secret_access_key=B2_APP_KEY,
-            config=Config(signature_version='s3v4')
+            # Enough pooled connections for every download thread
+            config=Config(signature_version='s3v4', max_pool_connections=MAX_WORKERS)
         )
         logger.info(f"B2 client initialized for bucket {B2_BUCKET_NAME}")
         return s3_client, B2_BUCKET_NAME
@@ -64,9 +74,10 @@ def setup_b2_client():
         logger.error(f"Failed to initialize B2 client: {str(e)}")
         return None, None
 
+@lru_cache(maxsize=1)
 def setup_supabase_client():
     # Load environment variables
-    load_dotenv()
+    _load_env()
     
     # Supabase configuration
     SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -90,11 +101,11 @@ def get_songs_from_supabase(supabase, limit=10, song_ids=None):
         if song_ids:
             # Get specific songs by IDs
             logger.info(f"Fetching songs with IDs: {song_ids}")
-            response = supabase.table('songs').select('*').in_('id', song_ids).execute()
+            response = supabase.table('songs').select('id,title,artist').in_('id', song_ids).execute()
         else:
             # Get random songs
             logger.info(f"Fetching {limit} random songs")
-            response = supabase.table('songs').select('*').limit(limit).execute()
+            response = supabase.table('songs').select('id,title,artist').limit(limit).execute()
         
         if not response.data:
             logger.error("No songs found in Supabase")
@@ -113,49 +124,51 @@ def create_output_dir(dir_name):
         logger.info(f"Created directory {dir_name}")
     return dir_name
 
-def get_thumbnail_from_b2(s3_client, bucket_name, song_id, output_dir):
+def thumbnail_key(song_id):
+    """B2 key of a song's thumbnail: leading zeros stripped, then padded to 6 digits"""
+    return f"thumbnails/{song_id.lstrip('0').zfill(6)}.png"
+
+def get_thumbnail_from_b2(s3_client, bucket_name, song_id, thumbnail_path, output_dir):
     """Download thumbnail from B2 and save to output directory"""
-    # Clean the song ID
-    # First strip leading zeros
-    clean_id = song_id.lstrip('0')
-    # Then format to 6 digits with leading zeros
-    formatted_id = clean_id.zfill(6)
+    # A non-empty file from an earlier run is reused; --clear-cache removes these first
+    output_path = os.path.join(output_dir, f"{song_id}.png")
+    try:
+        size = os.stat(output_path).st_size
+    except FileNotFoundError:
+        size = 0
+    if size > 0:
+        logger.info(f"✅ Using cached thumbnail for song {song_id} ({size/1024:.2f} KB)")
+        return True, output_path, size
     
-    # Generate the thumbnail path
-    thumbnail_path = f"thumbnails/{formatted_id}.png"
     logger.info(f"Looking for thumbnail at path: {thumbnail_path}")
     
     try:
-        # Check if the object exists
-        s3_client.head_object(Bucket=bucket_name, Key=thumbnail_path)
-        
-        # Generate presigned URL
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': thumbnail_path},
-            ExpiresIn=3600
-        )
-        
-        # Download the thumbnail
+        # Download the thumbnail in one request; a missing object raises ClientError
         start_time = time.time()
-        response = requests.get(presigned_url, timeout=10)
+        body = s3_client.get_object(Bucket=bucket_name, Key=thumbnail_path)['Body']
+        
+        # Stream the thumbnail to disk instead of holding it in memory. Write to a .part
+        # file first so an interrupted download is never mistaken for a cached thumbnail
+        part_path = output_path + '.part'
+        try:
+            with open(part_path, 'wb') as f:
+                shutil.copyfileobj(body, f, 64 * 1024)
+                size = f.tell()
+            os.replace(part_path, output_path)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
         download_time = time.time() - start_time
         
-        if response.status_code == 200:
-            # Save the thumbnail
-            output_path = os.path.join(output_dir, f"{song_id}.png")
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            
-            logger.info(f"✅ Downloaded thumbnail for song {song_id} ({len(response.content)/1024:.2f} KB in {download_time:.2f}s)")
-            return True, output_path, response.content
-        else:
-            logger.error(f"❌ Failed to download thumbnail for song {song_id}: HTTP {response.status_code}")
-            return False, None, None
+        logger.info(f"✅ Downloaded thumbnail for song {song_id} ({size/1024:.2f} KB in {download_time:.2f}s)")
+        return True, output_path, size
     
     except s3_client.exceptions.ClientError as e:
         error_code = e.response.get('Error', {}).get('Code', 'Unknown')
-        if error_code == '404':
+        if error_code in ('404', 'NoSuchKey'):
             logger.error(f"❌ Thumbnail not found for song {song_id} at path {thumbnail_path}")
         else:
             logger.error(f"❌ Error accessing thumbnail for song {song_id}: {error_code} - {str(e)}")
@@ -174,28 +187,22 @@ def render_ascii_art(image_data, width=40):
         # Open the image from bytes
         image = Image.open(io.BytesIO(image_data))
         
-        # Resize image to maintain aspect ratio
+        # Convert to grayscale first so the resize only has one channel to filter,
+        # keeping the aspect ratio
         height = int((width / image.width) * image.height) // 2
-        image = image.resize((width, height))
-        
-        # Convert to grayscale
-        image = image.convert('L')
+        image = image.convert('L').resize((width, height), Image.BILINEAR)
         
         # ASCII characters from darkest to lightest
         ascii_chars = '@%#*+=-:. '
         
-        # Create ASCII representation
-        ascii_art = []
-        for y in range(height):
-            line = ''
-            for x in range(width):
-                pixel_value = image.getpixel((x, y))
-                # Map pixel value to ASCII character
-                char_index = min(len(ascii_chars) - 1, pixel_value * len(ascii_chars) // 255)
-                line += ascii_chars[char_index]
-            ascii_art.append(line)
+        # Map every pixel value to its ASCII character in one bytes.translate call
+        table = bytes(
+            ord(ascii_chars[min(len(ascii_chars) - 1, value * len(ascii_chars) // 255)])
+            for value in range(256)
+        )
+        pixels = image.tobytes().translate(table).decode('ascii')
         
-        return '\n'.join(ascii_art)
+        return '\n'.join(pixels[y * width:(y + 1) * width] for y in range(height))
     
     except ImportError:
         return "[ASCII preview requires Pillow library]"
@@ -226,17 +233,14 @@ def main():
         logger.error(f"Failed to connect to B2: {str(e)}")
         return
     
+    # Clear output directory if requested, dropping it wholesale rather than file by file
+    if args.clear_cache and os.path.isdir(args.save_dir):
+        shutil.rmtree(args.save_dir)
+        logger.info(f"Cleared output directory: {args.save_dir}")
+    
     # Create output directory
     output_dir = create_output_dir(args.save_dir)
     
-    # Clear output directory if requested
-    if args.clear_cache and os.path.exists(output_dir):
-        for filename in os.listdir(output_dir):
-            file_path = os.path.join(output_dir, filename)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-        logger.info(f"Cleared output directory: {output_dir}")
-    
     # Get songs to test
     song_ids_list = None
     if args.song_ids:
@@ -257,19 +261,28 @@ def main():
         "song_results": []
     }
     
+    testable_songs = []
     for song in songs:
         song_id = song.get('id')
         if not song_id:
             logger.warning(f"Song missing ID, skipping: {song}")
             continue
-        
-        song_id = str(song_id)
+        testable_songs.append((str(song_id), song))
+    
+    # Work out every thumbnail key up front, before handing songs to the workers
+    keys = [thumbnail_key(song_id) for song_id, _ in testable_songs]
+    
+    def test_song(item, key):
+        song_id, song = item
         logger.info(f"Testing thumbnail for song: {song_id} - {song.get('title', 'Unknown Title')}")
-        
-        success, output_path, image_data = get_thumbnail_from_b2(
-            s3_client, bucket_name, song_id, output_dir
-        )
-        
+        return get_thumbnail_from_b2(s3_client, bucket_name, song_id, key, output_dir)
+    
+    # Downloads are network-bound, so run them concurrently on the shared client;
+    # results come back in song order so the report and previews stay ordered
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        downloads = list(executor.map(test_song, testable_songs, keys))
+    
+    for (song_id, song), (success, output_path, size) in zip(testable_songs, downloads):
         result = {
             "song_id": song_id,
             "title": song.get('title', 'Unknown'),
@@ -281,8 +294,9 @@ def main():
         if success:
             results["success_count"] += 1
             # Display ASCII preview if requested
-            if args.ascii and image_data:
-                ascii_art = render_ascii_art(image_data)
+            if args.ascii and size:
+                with open(output_path, 'rb') as f:
+                    ascii_art = render_ascii_art(f.read())
                 print("\n" + "-" * 80)
                 print(f"Song: {song.get('title', 'Unknown')} by {song.get('artist', 'Unknown')}")
                 print("-" * 80)
@@ -295,8 +309,8 @@ def main():
     
     # Write results to file
     results_path = os.path.join(output_dir, "results.json")
-    with open(results_path, 'w') as f:
-        json.dump(results, f, indent=2)
+    with open(results_path, 'wb') as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
     
     # Print summary
     print("\n" + "=" * 80)
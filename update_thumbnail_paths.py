@@ -19,6 +19,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of songs updated per set_thumbnail_paths call
+BATCH_SIZE = 500
+
+# Rows fetched per request when paging through the songs table
+PAGE_SIZE = 1000
+
 def main():
     # Load environment variables
     if os.path.exists('.env'):
@@ -35,47 +41,71 @@ def main():
     logger.info(f"Connecting to Supabase at {supabase_url}")
     supabase = create_client(supabase_url, supabase_key)
     
-    # Fetch songs from the database
-    try:
-        logger.info("Fetching songs from the database...")
-        response = supabase.table('songs').select('id', 'thumbnail_path').execute()
-        
-        if not response.data:
-            logger.error("No songs found in the database")
-            sys.exit(1)
-            
-        songs = response.data
-        logger.info(f"Retrieved {len(songs)} songs from the database")
-    except Exception as e:
-        logger.error(f"Error fetching songs: {str(e)}")
-        sys.exit(1)
+    def flush(batch):
+        """Send one set_thumbnail_paths call, returning the number of rows updated"""
+        try:
+            response = supabase.rpc('set_thumbnail_paths', {
+                'p_ids': [song_id for song_id, _ in batch],
+                'p_paths': [path for _, path in batch]
+            }).execute()
+            return response.data
+        except Exception as e:
+            logger.error(f"Error updating thumbnail paths for {len(batch)} songs: {str(e)}")
+            return 0
     
-    # Update thumbnail paths
+    # Page through the songs (PostgREST caps a single select at 1000 rows), fixing
+    # each page as it arrives and updating in batches rather than one request per song
+    logger.info("Fetching songs from the database...")
+    total_songs = 0
     updated_count = 0
-    for song in songs:
-        song_id = song.get('id')
-        thumbnail_path = song.get('thumbnail_path')
+    updates = []
+    offset = 0
+    while True:
+        try:
+            songs = (supabase.table('songs').select('id', 'thumbnail_path').order('id')
+                     .range(offset, offset + PAGE_SIZE - 1).execute().data)
+        except Exception as e:
+            logger.error(f"Error fetching songs: {str(e)}")
+            sys.exit(1)
+        if not songs:
+            break
+        total_songs += len(songs)
+        offset += PAGE_SIZE
         
-        if not thumbnail_path:
-            logger.info(f"Song {song_id} has no thumbnail path, skipping")
-            continue
+        # Format according to B2 bucket pattern: thumbnails/000XXX.png (3 leading zeros
+        # before the numeric ID without its own leading zeros), computed for the page at once
+        correct_paths = [f"thumbnails/000{song['id'].lstrip('0')}.png" for song in songs]
         
-        # Extract the numeric ID without leading zeros
-        numeric_id = song_id.lstrip('0')
+        # Collect the songs whose thumbnail path needs to change
+        for song, correct_path in zip(songs, correct_paths):
+            song_id = song.get('id')
+            thumbnail_path = song.get('thumbnail_path')
+            
+            if not thumbnail_path:
+                logger.info(f"Song {song_id} has no thumbnail path, skipping")
+                continue
+            
+            # Only update if different
+            if thumbnail_path != correct_path:
+                logger.info(f"Updating thumbnail path for song {song_id}: {thumbnail_path} -> {correct_path}")
+                updates.append((song_id, correct_path))
         
-        # Format according to B2 bucket pattern: thumbnails/000XXX.png (3 leading zeros)
-        correct_path = f"thumbnails/000{numeric_id}.png"
+        while len(updates) >= BATCH_SIZE:
+            updated_count += flush(updates[:BATCH_SIZE])
+            del updates[:BATCH_SIZE]
         
-        # Only update if different
-        if thumbnail_path != correct_path:
-            try:
-                logger.info(f"Updating thumbnail path for song {song_id}: {thumbnail_path} -> {correct_path}")
-                supabase.table('songs').update({"thumbnail_path": correct_path}).eq('id', song_id).execute()
-                updated_count += 1
-            except Exception as e:
-                logger.error(f"Error updating thumbnail path for song {song_id}: {str(e)}")
+        if len(songs) < PAGE_SIZE:
+            break
+    
+    if not total_songs:
+        logger.error("No songs found in the database")
+        sys.exit(1)
+    logger.info(f"Retrieved {total_songs} songs from the database")
+    
+    if updates:
+        updated_count += flush(updates)
     
-    logger.info(f"Update complete. Updated {updated_count} out of {len(songs)} songs.")
+    logger.info(f"Update complete. Updated {updated_count} out of {total_songs} songs.")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
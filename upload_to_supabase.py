@@ -1,15 +1,20 @@
 import os
-import json
+import re
+import mmap
+import orjson
 import base64
 import hashlib
 import logging
 import argparse
 import time
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple, Set
 import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from backfill_has_thumbnail import backfill as backfill_has_thumbnail, create_b2_client
 from tqdm import tqdm
 from datetime import datetime
 
@@ -41,17 +46,33 @@ logger.addHandler(console_handler)
 logger.addHandler(file_handler)
 logger.setLevel(logging.INFO)
 
-# Supabase configuration
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL", ""),
-    os.getenv("SUPABASE_KEY", "")
-)
-
 # Constants
-BATCH_SIZE = 50
+BATCH_SIZE = 500
 MAXIMUM_RETRIES = 3
 RETRY_DELAY = 5  # seconds
+API_WORKERS = 16  # concurrent per-song Supabase requests
+PREPARE_CHUNKSIZE = 64  # metadata files handed to a parsing process at a time
+MMAP_THRESHOLD = 64 * 1024  # metadata files larger than this are memory-mapped
 INDEX_FILE = "supabase_upload_index.json"
+PAGE_SIZE = 1000  # rows per request when loading whole tables
+
+# Tag name -> tag ID, loaded once per upload and extended as new tags are created
+_TAG_CACHE: Dict[str, int] = {}
+
+@lru_cache(maxsize=1)
+def get_supabase_client() -> Client:
+    """
+    Create the Supabase client on first use and share it afterwards.
+    
+    Its HTTP session keeps connections alive, so every request after the first
+    reuses an open TLS connection. Parsing worker processes never create one.
+    """
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
+    
+    return create_client(url, key)
 
 def format_timestamp(dt: Optional[datetime] = None) -> str:
     """Format timestamp in PostgreSQL-compatible ISO format."""
@@ -59,6 +80,9 @@ def format_timestamp(dt: Optional[datetime] = None) -> str:
         dt = datetime.utcnow()
     return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
+# Public URL of the B2 bucket holding the media files
+B2_PUBLIC_URL = "https://spotifyclonemp3.s3.eu-central-003.backblazeb2.com/"
+
 def get_b2_url(file_id: str, file_type: str) -> str:
     """
     Generate a URL for a file in the B2 bucket.
@@ -71,85 +95,74 @@ def get_b2_url(file_id: str, file_type: str) -> str:
         The URL to the file
     """
     if file_type == "audio":
-        extension = "mp3"
-        path = "audio"
-    else:
-        extension = "png"
-        path = "thumbnails"
-    
-    return f"https://spotifyclonemp3.s3.eu-central-003.backblazeb2.com/{path}/{file_id}.{extension}"
+        return f"{B2_PUBLIC_URL}audio/{file_id}.mp3"
+    return f"{B2_PUBLIC_URL}thumbnails/{file_id}.png"
+
+# Validates a YYYYMMDD date and captures its parts in one match
+YYYYMMDD = re.compile(r"(\d{4})(\d{2})(\d{2})")
 
 def format_date(date_str: str) -> str:
     """Convert YYYYMMDD string to YYYY-MM-DD format for PostgreSQL."""
-    if not date_str or len(date_str) != 8:
+    if not date_str:
         return None
     
-    try:
-        year = date_str[0:4]
-        month = date_str[4:6]
-        day = date_str[6:8]
-        return f"{year}-{month}-{day}"
-    except (IndexError, ValueError):
+    match = YYYYMMDD.fullmatch(date_str)
+    if not match:
         logger.warning(f"Invalid date format: {date_str}")
         return None
+    return "-".join(match.groups())
+
+# Columns of the songs table that metadata may fill
+SONG_COLUMNS = frozenset({
+    "id", "title", "artist", "album", "duration", "release_date", 
+    "view_count", "like_count", "description", "youtube_url", 
+    "youtube_id", "storage_path", "thumbnail_path", "storage_url", 
+    "thumbnail_url", "created_at", "updated_at", "tags"
+})
+
+# Metadata field -> DB column, for every field that ends up in the database.
+# Column names map to themselves; any other field is dropped
+FIELD_TO_COLUMN = {
+    **{column: column for column in SONG_COLUMNS},
+    # General field mappings
+    "file_path": "storage_path",
+    # The database uses storage_url and thumbnail_url columns
+    "audio_url": "storage_url",
+    # Map source_url to youtube_url
+    "source_url": "youtube_url",
+}
 
 def sanitize_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Clean up data before inserting into database."""
-    # Create a mapping from metadata fields to DB columns
-    field_mapping = {
-        # General field mappings
-        "file_path": "storage_path",
-        "thumbnail_path": "thumbnail_path",
-        
-        # The database uses storage_url and thumbnail_url columns
-        "audio_url": "storage_url",
-        "thumbnail_url": "thumbnail_url",
-        
-        # Map source_url to youtube_url
-        "source_url": "youtube_url",
-    }
-    
-    # Convert metadata fields to DB column names
-    mapped_data = {}
+    # Convert metadata fields to DB column names in one pass, dropping unknown fields
+    sanitized = {}
     for key, value in data.items():
-        # Map the key if it exists in mapping, otherwise use the original key
-        db_key = field_mapping.get(key, key)
-        if value is not None:
-            mapped_data[db_key] = value
+        column = FIELD_TO_COLUMN.get(key)
+        if column is not None and value is not None:
+            sanitized[column] = value
     
     # Convert release_date from YYYYMMDD to YYYY-MM-DD
-    if "release_date" in mapped_data and mapped_data["release_date"]:
-        mapped_data["release_date"] = format_date(mapped_data["release_date"])
+    if sanitized.get("release_date"):
+        sanitized["release_date"] = format_date(sanitized["release_date"])
     
-    # Get file ID
-    file_id = data.get("id") or mapped_data.get("id")
+    # Get file ID, or try to extract it from the file path
+    file_id = data.get("id")
     if not file_id and "file_path" in data:
-        # Try to extract file ID from file path
-        file_path = data["file_path"]
-        file_id = Path(file_path).stem
+        file_id = Path(data["file_path"]).stem
     
-    # Generate paths and URLs based on file ID
+    # Generate paths and URLs based on file ID; each key is built once and
+    # serves as both the default path and the tail of its URL
     if file_id:
-        # Always set the storage path fields
-        if "storage_path" not in mapped_data:
-            mapped_data["storage_path"] = f"audio/{file_id}.mp3"
+        audio_key = f"audio/{file_id}.mp3"
+        thumbnail_key = f"thumbnails/{file_id}.png"
         
-        if "thumbnail_path" not in mapped_data:
-            mapped_data["thumbnail_path"] = f"thumbnails/{file_id}.png"
+        # Always set the storage path fields
+        sanitized.setdefault("storage_path", audio_key)
+        sanitized.setdefault("thumbnail_path", thumbnail_key)
             
         # ALWAYS set the URLs, overriding any existing values
-        mapped_data["storage_url"] = get_b2_url(file_id, "audio")
-        mapped_data["thumbnail_url"] = get_b2_url(file_id, "thumbnail")
-    
-    # Remove any fields that don't exist in the schema
-    valid_columns = {
-        "id", "title", "artist", "album", "duration", "release_date", 
-        "view_count", "like_count", "description", "youtube_url", 
-        "youtube_id", "storage_path", "thumbnail_path", "storage_url", 
-        "thumbnail_url", "created_at", "updated_at", "tags"
-    }
-    
-    sanitized = {k: v for k, v in mapped_data.items() if k in valid_columns}
+        sanitized["storage_url"] = B2_PUBLIC_URL + audio_key
+        sanitized["thumbnail_url"] = B2_PUBLIC_URL + thumbnail_key
     
     # Final check to ensure required fields have values
     if "id" in sanitized and "storage_path" not in sanitized:
@@ -164,43 +177,159 @@ def sanitize_data(data: Dict[str, Any]) -> Dict[str, Any]:
     
     return sanitized
 
-def insert_tags(supabase_client, song_id: str, tags: List[str]) -> None:
-    """Insert tags for a song."""
-    if not tags:
+def prime_tag_cache(supabase_client) -> None:
+    """Load every existing tag into the tag cache, page by page."""
+    _TAG_CACHE.clear()
+    offset = 0
+    while True:
+        result = supabase_client.table("tags") \
+            .select("id, name") \
+            .order("id") \
+            .range(offset, offset + PAGE_SIZE - 1) \
+            .execute()
+        _TAG_CACHE.update((tag_record["name"], tag_record["id"]) for tag_record in result.data)
+        if len(result.data) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    logger.info(f"Loaded {len(_TAG_CACHE)} tags into the tag cache")
+
+def load_existing_song_ids(supabase_client) -> Set[str]:
+    """Load the IDs of every song already in the database, page by page."""
+    song_ids = set()
+    offset = 0
+    while True:
+        result = supabase_client.table("songs") \
+            .select("id") \
+            .order("id") \
+            .range(offset, offset + PAGE_SIZE - 1) \
+            .execute()
+        song_ids.update(record["id"] for record in result.data)
+        if len(result.data) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    logger.info(f"Found {len(song_ids)} songs already in the database")
+    return song_ids
+
+def insert_tags(supabase_client, song_tags: Dict[str, List[str]]) -> None:
+    """Insert tags for a batch of songs, replacing each song's existing tags."""
+    # Normalize tag names, dropping empty, non-string and repeated ones per song.
+    # Raw duplicates go first so each distinct spelling is only normalized once
+    names_by_song = {}
+    for song_id, tags in song_tags.items():
+        raw_tags = dict.fromkeys(tag for tag in tags if isinstance(tag, str))
+        names = dict.fromkeys(tag.strip().lower() for tag in raw_tags)
+        names.pop("", None)
+        if names:
+            names_by_song[song_id] = list(names)
+    
+    if not names_by_song:
         return
     
-    # First, make sure all tags exist in the tags table
-    tag_objects = []
-    for tag_name in tags:
-        tag_name = tag_name.strip().lower()
-        if not tag_name:
-            continue
-        tag_objects.append({"name": tag_name})
-    
-    if tag_objects:
-        # Upsert tags to ensure they exist
-        supabase_client.table("tags").upsert(
-            tag_objects, 
+    # Only tags missing from the cache need a request: upsert them all at once,
+    # the returned rows carry their IDs
+    missing_names = sorted({name for names in names_by_song.values() for name in names} - _TAG_CACHE.keys())
+    if missing_names:
+        tag_results = supabase_client.table("tags").upsert(
+            [{"name": name} for name in missing_names],
             on_conflict="name"
         ).execute()
+        _TAG_CACHE.update((tag_record["name"], tag_record["id"]) for tag_record in tag_results.data)
+    tag_ids = _TAG_CACHE
+    
+    # Create song_tags relationships
+    song_tag_objects = [
+        {"song_id": song_id, "tag_id": tag_ids[name]}
+        for song_id, names in names_by_song.items()
+        for name in names if name in tag_ids
+    ]
+    
+    if song_tag_objects:
+        # First delete existing relationships
+        supabase_client.table("song_tags").delete().in_("song_id", list(names_by_song)).execute()
+        
+        # Then insert new relationships in one request, ignoring pairs that are already there
+        supabase_client.table("song_tags").upsert(
+            song_tag_objects,
+            on_conflict="song_id,tag_id",
+            ignore_duplicates=True,
+            returning="minimal"
+        ).execute()
+
+def read_metadata(json_file: Path) -> Tuple[str, Any]:
+    """
+    Hash and parse a metadata file from a single read.
+    
+    The raw bytes are hashed for tracking and handed to orjson as they are,
+    without decoding to str first. Large files are memory-mapped instead of
+    copied into a bytes object.
+    
+    Returns:
+        (file_hash, metadata), where metadata is None for an empty file
+    """
+    with open(json_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= MMAP_THRESHOLD:
+            file_bytes = f.read()
+            return hashlib.md5(file_bytes).hexdigest(), orjson.loads(file_bytes) if file_bytes else None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return hashlib.md5(view).hexdigest(), orjson.loads(view)
+
+def prepare_file(json_file: Path) -> Tuple[str, Optional[str], Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Read, hash, parse and sanitize one metadata file. Runs in a worker process.
+    
+    Args:
+        json_file: Path to the metadata JSON file
+        
+    Returns:
+        (status, file_hash, record_data, detail) where status is "ok", "empty",
+        "json_error" or "error". detail is the media file path for "ok" and the
+        error message for "error".
+    """
+    try:
+        try:
+            file_hash, metadata = read_metadata(json_file)
+        except orjson.JSONDecodeError:
+            return "json_error", None, None, None
         
-        # Get tag IDs for the inserted tag names
-        tag_results = supabase_client.table("tags").select("id, name").in_("name", [obj["name"] for obj in tag_objects]).execute()
+        if metadata is None:
+            return "empty", file_hash, None, None
         
-        # Create song_tags relationships
-        song_tag_objects = []
-        for tag_record in tag_results.data:
-            song_tag_objects.append({
-                "song_id": song_id,
-                "tag_id": tag_record["id"]
-            })
+        # Process the metadata for inserting into Supabase
+        record_data = sanitize_data(metadata)
         
-        if song_tag_objects:
-            # First delete existing relationships
-            supabase_client.table("song_tags").delete().eq("song_id", song_id).execute()
-            
-            # Then insert new relationships
-            supabase_client.table("song_tags").insert(song_tag_objects).execute()
+        # Make sure we have an ID (assuming filename is the song ID)
+        if "id" not in record_data:
+            record_data["id"] = json_file.stem
+        
+        return "ok", file_hash, record_data, metadata.get("file_path", "")
+    except Exception as e:
+        return "error", None, None, str(e)
+
+def prepare_files(executor: ProcessPoolExecutor, json_files: List[Path], window: int):
+    """
+    Yield prepare_file() results in file order, submitting the files to the pool one
+    window at a time.
+    
+    The next window is submitted before the current one is consumed, so parsing keeps
+    overlapping the uploads while at most two windows of records are held in memory
+    (executor.map over all files would parse the whole catalog ahead of the uploads).
+    """
+    pending = None
+    for start in range(0, len(json_files), window):
+        submitted = executor.map(prepare_file, json_files[start:start + window], chunksize=PREPARE_CHUNKSIZE)
+        if pending is not None:
+            yield from pending
+        pending = submitted
+    if pending is not None:
+        yield from pending
+
+def list_dir_files(directory: Path) -> Set[str]:
+    """Return the names of the files in a directory, or an empty set if it doesn't exist."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
 
 def calculate_file_hash(file_path: str) -> str:
     """Calculate MD5 hash of a file."""
@@ -269,7 +398,7 @@ def get_latest_version(supabase_client, song_id: str) -> Tuple[int, Optional[Dic
             .limit(1) \
             .execute()
         
-            if result.data:
+        if result.data:
             return result.data[0]["version_number"], result.data[0]
         return 0, None
     except Exception as e:
@@ -380,10 +509,10 @@ def load_file_index() -> Dict[str, Any]:
     """
     if os.path.exists(INDEX_FILE):
         try:
-            with open(INDEX_FILE, 'r') as f:
-                index = json.load(f)
+            with open(INDEX_FILE, 'rb') as f:
+                index = orjson.loads(f.read())
                 return index
-        except (json.JSONDecodeError, IOError) as e:
+        except (orjson.JSONDecodeError, IOError) as e:
             logger.error(f"Error loading index file: {e}")
             
     # Default structure if file doesn't exist or is invalid
@@ -403,8 +532,8 @@ def save_file_index(index: Dict[str, Any]):
     index["last_run"] = format_timestamp()
     
     try:
-        with open(INDEX_FILE, 'w') as f:
-            json.dump(index, f, indent=2)
+        with open(INDEX_FILE, 'wb') as f:
+            f.write(orjson.dumps(index, option=orjson.OPT_INDENT_2))
     except IOError as e:
         logger.error(f"Error saving index file: {e}")
 
@@ -425,7 +554,8 @@ def update_file_index(index: Dict[str, Any], file_path: str, file_hash: str, suc
             "processed_at": format_timestamp()
         }
 
-def get_changed_files(metadata_dir: str, index: Dict[str, Any], force: bool = False) -> List[Path]:
+def get_changed_files(metadata_dir: str, index: Dict[str, Any], force: bool = False,
+                      json_files: Optional[List[Path]] = None) -> List[Path]:
     """
     Identify which files have changed since the last run.
     
@@ -433,12 +563,13 @@ def get_changed_files(metadata_dir: str, index: Dict[str, Any], force: bool = Fa
         metadata_dir: Directory containing metadata files
         index: The index data structure
         force: Whether to force processing of all files
+        json_files: Metadata files already listed by the caller (optional)
         
     Returns:
         List of Path objects for files that need processing
     """
-    metadata_path = Path(metadata_dir)
-    json_files = list(metadata_path.glob("**/*.json"))
+    if json_files is None:
+        json_files = list(Path(metadata_dir).glob("**/*.json"))
     
     if force:
         # If force is True, process all files
@@ -458,13 +589,32 @@ def get_changed_files(metadata_dir: str, index: Dict[str, Any], force: bool = Fa
         # 1. It's not in the index
         # 2. Its modification time is newer than what's recorded
         # 3. Its size is zero (to re-check empty files in case they've been populated)
-        if (not file_info or 
-            os.path.getmtime(file_path) > file_info.get("mtime", 0) or
-            os.path.getsize(file_path) == 0):
+        if not file_info:
+            files_to_process.append(file_path)
+            continue
+        file_stat = file_path.stat()
+        if file_stat.st_mtime > file_info.get("mtime", 0) or file_stat.st_size == 0:
             files_to_process.append(file_path)
     
     return files_to_process
 
+def flag_thumbnails_from_b2(supabase_client, song_ids: List[str], b2_bucket_name: Optional[str] = None) -> None:
+    """Set has_thumbnail for the given songs from the thumbnails in the B2 bucket."""
+    b2_key_id = os.environ.get("B2_KEY_ID")
+    b2_app_key = os.environ.get("B2_APP_KEY")
+    b2_bucket_name = b2_bucket_name or os.environ.get("B2_BUCKET_NAME")
+    if not all([b2_key_id, b2_app_key, b2_bucket_name]):
+        logger.warning(f"No B2 credentials, so has_thumbnail was not set for {len(song_ids)} songs. "
+                       f"Run backfill_has_thumbnail.py to show them in the song list")
+        return
+    
+    try:
+        s3_client = create_b2_client(b2_key_id, b2_app_key)
+        flagged, _, total = backfill_has_thumbnail(supabase_client, s3_client, b2_bucket_name, song_ids)
+        logger.info(f"Flagged {flagged} of {total} uploaded songs with a thumbnail")
+    except Exception as e:
+        logger.error(f"Error setting has_thumbnail, run backfill_has_thumbnail.py: {e}")
+
 def upload_metadata_to_supabase(
     metadata_dir: str,
     base_dir: Optional[str] = None,
@@ -474,7 +624,8 @@ def upload_metadata_to_supabase(
     batch_size: int = BATCH_SIZE,
     enable_versioning: bool = True,
     skip_media_check: bool = False,
-    force_url_updates: bool = False
+    force_url_updates: bool = False,
+    skip_existing: bool = False
 ) -> Dict[str, int]:
     """
     Upload metadata to Supabase.
@@ -489,27 +640,33 @@ def upload_metadata_to_supabase(
         enable_versioning: Whether to save versioned copies of each record
         skip_media_check: Skip checking if media files exist
         force_url_updates: Force update of all URLs
+        skip_existing: Skip songs already in the database (unless force is set)
         
     Returns:
         Statistics about the upload process
     """
     # Initialize Supabase client
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_KEY")
-    if not url or not key:
-        raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
-    
-    supabase_client = create_client(url, key)
+    supabase_client = get_supabase_client()
     
     # Set up versioning tables if enabled
     if enable_versioning:
         setup_versioning_tables(supabase_client)
     
+    # Resolve existing tag IDs locally instead of asking for them per batch
+    try:
+        prime_tag_cache(supabase_client)
+    except Exception as e:
+        logger.warning(f"Could not load tags, they will be fetched as batches need them: {e}")
+    
+    # Load every existing song ID up front, so re-runs skip those songs without a request each
+    existing_ids = load_existing_song_ids(supabase_client) if skip_existing and not force else set()
+    
     # Statistics
     stats = {
         "total_files": 0,
         "processed_files": 0,
         "skipped_unchanged": 0,
+        "skipped_existing": 0,  # Files skipped because their song is already in the database
         "skipped_indexed": 0,  # Files skipped because index showed they haven't changed
         "empty_files": 0,
         "json_decode_errors": 0,
@@ -535,8 +692,8 @@ def upload_metadata_to_supabase(
     
     # Get list of files to process (all or only changed)
     if incremental and not force:
-        json_files = get_changed_files(metadata_dir, index, force)
         all_files = list(Path(metadata_dir).glob("**/*.json"))
+        json_files = get_changed_files(metadata_dir, index, force, all_files)
         stats["skipped_indexed"] = len(all_files) - len(json_files)
         logger.info(f"Using index to skip {stats['skipped_indexed']} unchanged files")
     else:
@@ -544,6 +701,18 @@ def upload_metadata_to_supabase(
     
     stats["total_files"] = len(json_files)
     
+    # Names of the files in each media directory, listed once on first use
+    media_listings: Dict[Path, Set[str]] = {}
+    
+    def media_exists(media_path: Path) -> bool:
+        media_dir = media_path.parent
+        if media_dir not in media_listings:
+            media_listings[media_dir] = list_dir_files(media_dir)
+        return media_path.name in media_listings[media_dir]
+    
+    # Songs whose thumbnail wasn't checked locally; flagged from B2 after the upload
+    unchecked_thumbnail_ids: List[str] = []
+    
     # Process files in batches
     batch_data = []
     batch_file_info = []  # Store file paths and hashes for versioning
@@ -553,36 +722,38 @@ def upload_metadata_to_supabase(
     original_level = console_handler.level
     console_handler.setLevel(logging.ERROR)
     
-    # Initialize progress bar
-    with tqdm(total=len(json_files), desc="Processing files", unit="files") as progress_bar:
-        for idx, json_file in enumerate(json_files):
+    # Initialize progress bar. Reading, hashing, parsing and sanitizing the files is
+    # CPU-bound, so worker processes prepare them (in order) while this loop talks to Supabase
+    with tqdm(total=len(json_files), desc="Processing files", unit="files") as progress_bar, \
+            ProcessPoolExecutor() as executor:
+        prepared = prepare_files(executor, json_files, batch_size)
+        for idx, (json_file, (status, file_hash, record_data, detail)) in enumerate(zip(json_files, prepared)):
             song_id = json_file.stem  # Assuming filename is the song ID
             
-            # Update progress bar with file info but keep it clean
-            progress_bar.set_description(f"File {idx+1}/{len(json_files)}")
-            progress_bar.set_postfix_str(f"{json_file.name}")
+            # Update progress bar with file info but keep it clean. Don't redraw here:
+            # update() repaints at most every tqdm.mininterval instead of twice per file
+            progress_bar.set_description(f"File {idx+1}/{len(json_files)}", refresh=False)
+            progress_bar.set_postfix_str(json_file.name, refresh=False)
             
             try:
-                # Calculate file hash for tracking
-                file_hash = calculate_file_hash(json_file)
-                
-                # Read and parse the JSON file to check for content changes
                 # We always need to read the file content to check for metadata changes
-                if json_file.stat().st_size == 0:
+                if status == "empty":
                     logger.warning(f"Empty file: {json_file}")
                     stats["empty_files"] += 1
                     progress_bar.update(1)
                     continue
-                    
-                with open(json_file, "r", encoding="utf-8") as f:
-                    metadata = json.load(f)
-                
-                # Process the metadata for inserting into Supabase
-                record_data = sanitize_data(metadata)
+                if status == "json_error":
+                    logger.warning(f"Error decoding JSON: {json_file}")
+                    stats["json_decode_errors"] += 1
+                    progress_bar.update(1)
+                    continue
+                if status == "error":
+                    raise Exception(detail)
                 
-                # Make sure we have an ID
-                if "id" not in record_data:
-                    record_data["id"] = song_id
+                if record_data["id"] in existing_ids:
+                    stats["skipped_existing"] += 1
+                    progress_bar.update(1)
+                    continue
                 
                 # For force URL updates, we want to process the file even if it's unchanged
                 # But only check if we're not already forcing all processing
@@ -651,20 +822,28 @@ def upload_metadata_to_supabase(
                             progress_bar.update(1)
                             continue
                 
-                # Check if the associated media file exists (if checking is enabled)
+                # Check if the associated media file exists (if checking is enabled),
+                # against a listing of its directory rather than a stat per file
                 if not skip_media_check and base_dir:
-                    media_path = Path(base_dir) / metadata.get("file_path", "")
-                    if not media_path.exists():
+                    media_path = Path(base_dir) / detail
+                    if not media_exists(media_path):
                         logger.warning(f"Media file not found: {media_path}")
-                    stats["missing_media"] += 1
-                    progress_bar.update(1)
-                    continue
+                        stats["missing_media"] += 1
+                        progress_bar.update(1)
+                        continue
+                    
+                    # Flag the thumbnail from the same check, so the song shows up in the
+                    # default (thumbnails_only) song list without a backfill
+                    thumbnail_path = record_data.get("thumbnail_path")
+                    record_data["has_thumbnail"] = bool(thumbnail_path) and media_exists(Path(base_dir) / thumbnail_path)
+                else:
+                    unchecked_thumbnail_ids.append(record_data["id"])
                 
-                # Track null values for data quality reporting
+                # Track null values for data quality reporting. sanitize_data drops None
+                # values, so the missing columns are a set difference of the keys
                 total_records += 1
-                for column in null_value_counts.keys():
-                    if column not in record_data or record_data[column] is None:
-                        null_value_counts[column] += 1
+                for column in null_value_counts.keys() - record_data.keys():
+                    null_value_counts[column] += 1
                 
                 # Extract tags before adding to batch
                 tags = record_data.pop("tags", [])
@@ -675,17 +854,18 @@ def upload_metadata_to_supabase(
                 
                 # Process the batch if it reaches the batch size
                 if len(batch_data) >= batch_size:
-                    success = process_batch(supabase_client, batch_data, batch_file_info, stats, enable_versioning)
+                    stored = process_batch(supabase_client, batch_data, batch_file_info, stats, enable_versioning)
                     
                     # Update file index for processed files
-                    if success and incremental:
-                        for i, (file_path, file_hash, _) in enumerate(batch_file_info):
+                    if stored and incremental:
+                        for file_path, file_hash, _ in stored:
                             update_file_index(index, str(file_path), file_hash, success=True)
                         # Save index incrementally after each batch
                         save_file_index(index)
                     
                     # Update progress bar with brief batch stats
                     progress_bar.set_postfix(
+                        refresh=False,
                         batch=stats["batch_count"], 
                         processed=stats["processed_files"],
                         errors=stats["api_errors"]
@@ -696,10 +876,6 @@ def upload_metadata_to_supabase(
                 stats["processed_files"] += 1
                 progress_bar.update(1)
                 
-            except json.JSONDecodeError:
-                logger.warning(f"Error decoding JSON: {json_file}")
-                stats["json_decode_errors"] += 1
-                progress_bar.update(1)
             except Exception as e:
                 logger.error(f"Error processing {json_file}: {e}")
                 stats["api_errors"] += 1
@@ -707,15 +883,19 @@ def upload_metadata_to_supabase(
     
     # Process any remaining records in the last batch
     if batch_data:
-        success = process_batch(supabase_client, batch_data, batch_file_info, stats, enable_versioning)
+        stored = process_batch(supabase_client, batch_data, batch_file_info, stats, enable_versioning)
         
         # Update file index for the last batch
-        if success and incremental:
-            for i, (file_path, file_hash, _) in enumerate(batch_file_info):
+        if stored and incremental:
+            for file_path, file_hash, _ in stored:
                 update_file_index(index, str(file_path), file_hash, success=True)
             # Save index incrementally after the final batch
             save_file_index(index)
     
+    # New songs default to has_thumbnail = false, which hides them from the song list
+    if unchecked_thumbnail_ids:
+        flag_thumbnails_from_b2(supabase_client, unchecked_thumbnail_ids, b2_bucket_name)
+    
     # Restore console handler level
     console_handler.setLevel(original_level)
     
@@ -731,14 +911,14 @@ def process_batch(
     batch_file_info: List[Tuple], 
     stats: Dict[str, int],
     enable_versioning: bool
-) -> bool:
+) -> List[Tuple]:
     """Process a batch of records.
     
     Returns:
-        bool: Whether processing was successful
+        List[Tuple]: The file info of the records that were stored
     """
     if not batch_data:
-        return True
+        return []
     
     try:
         # Clean up batch data for Supabase
@@ -754,42 +934,57 @@ def process_batch(
                     record[key] = None
         
         # Perform upsert operation with retry
-        result = retry_api_call(
-            lambda: supabase_client.table("songs").upsert(
-                batch_data,
-                on_conflict="id"
-            ).execute()
-        )
+        stored = list(zip(batch_data, batch_file_info))
+        try:
+            retry_api_call(
+                lambda: supabase_client.table("songs").upsert(
+                    batch_data,
+                    on_conflict="id",
+                    returning="minimal"
+                ).execute()
+            )
+        except Exception as e:
+            # Fall back to one upsert per record so a single bad record doesn't sink the batch
+            logger.warning(f"Batch upsert failed, upserting {len(batch_data)} records one by one: {e}")
+            stored = []
+            for record, file_info in zip(batch_data, batch_file_info):
+                try:
+                    supabase_client.table("songs").upsert(
+                        record,
+                        on_conflict="id",
+                        returning="minimal"
+                    ).execute()
+                    stored.append((record, file_info))
+                except Exception as e:
+                    logger.error(f"Error upserting song {record.get('id')} from {file_info[0]}: {e}")
+                    stats["api_errors"] += 1
         
-        # Process versioning and tags for each record - but silently
+        # Save versions for each record - but silently. Each one is a lookup plus an
+        # insert, so overlap them across threads instead of waiting on one at a time
         versions_created = 0
-        for i, record in enumerate(batch_data):
-            if i < len(batch_file_info):  # Make sure we have file info for this record
-                song_id = record.get("id")
-                if song_id:
-                    # Save version if enabled
-                    if enable_versioning:
-                        _, file_hash, tags = batch_file_info[i]
-                        version_num = save_version(supabase_client, song_id, record, file_hash)
-                        if version_num > 1:  # If this is not the first version
-                            versions_created += 1
-                    
-                    # Process tags if any
-                    _, _, tags = batch_file_info[i]
-                    if tags:
-                        try:
-                            insert_tags(supabase_client, song_id, tags)
-                        except Exception as e:
-                            logger.error(f"Error inserting tags for song {song_id}: {e}")
+        if enable_versioning:
+            versioned = [(record["id"], record, file_hash) for record, (_, file_hash, _) in stored if record.get("id")]
+            with ThreadPoolExecutor(max_workers=API_WORKERS) as executor:
+                version_nums = executor.map(lambda item: save_version(supabase_client, *item), versioned)
+                # A version number above 1 means this is not the first version
+                versions_created = sum(1 for version_num in version_nums if version_num > 1)
+        
+        # Process the tags of the whole batch together
+        song_tags = {record["id"]: tags for record, (_, _, tags) in stored if record.get("id") and tags}
+        if song_tags:
+            try:
+                insert_tags(supabase_client, song_tags)
+            except Exception as e:
+                logger.error(f"Error inserting tags for {len(song_tags)} songs: {e}")
         
         stats["batch_count"] += 1
         stats["new_versions_created"] += versions_created
-        logger.debug(f"Processed batch {stats['batch_count']} with {len(batch_data)} records")
-        return True
+        logger.debug(f"Processed batch {stats['batch_count']} with {len(stored)}/{len(batch_data)} records stored")
+        return [file_info for _, file_info in stored]
     except Exception as e:
         logger.error(f"Error processing batch: {e}")
         stats["api_errors"] += 1
-        return False
+        return []
 
 def delete_today_uploads(clean_versions: bool = True) -> Dict[str, int]:
     """
@@ -802,12 +997,7 @@ def delete_today_uploads(clean_versions: bool = True) -> Dict[str, int]:
         Statistics about the deletion operation
     """
     # Initialize Supabase client
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_KEY")
-    if not url or not key:
-        raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
-    
-    supabase_client = create_client(url, key)
+    supabase_client = get_supabase_client()
     
     # Get today's date in ISO format
     today = datetime.utcnow().strftime("%Y-%m-%d")
@@ -866,9 +1056,9 @@ def delete_today_uploads(clean_versions: bool = True) -> Dict[str, int]:
                         .execute()
                     
                     stats["versions_deleted"] += len(versions_result.data)
-                except Exception as e:
+            except Exception as e:
                 logger.error(f"Error deleting song versions: {e}")
-                    stats["api_errors"] += 1
+                stats["api_errors"] += 1
                 
         # 4. Delete the songs themselves
         if today_song_ids:
@@ -909,6 +1099,7 @@ def main():
     parser.add_argument("--rebuild-index", action="store_true", help="Force rebuild the local file index")
     parser.add_argument("--skip-quality-report", action="store_true", help="Skip data quality report generation")
     parser.add_argument("--force-url-updates", action="store_true", help="Force update of storage and thumbnail URLs")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip songs already in the database (ignored with --force)")
     
     args = parser.parse_args()
     
@@ -982,6 +1173,7 @@ def main():
     print(f"Versioning: {'Disabled' if args.no_versioning else 'Enabled'}")
     print(f"Media check: {'Disabled' if args.skip_media_check else 'Enabled'}")
     print(f"Force URL updates: {'Enabled' if args.force_url_updates else 'Disabled'}")
+    print(f"Skip existing songs: {'Enabled' if args.skip_existing and not args.force else 'Disabled'}")
     print(f"--------------------------------\n")
     
     # Upload metadata
@@ -995,7 +1187,8 @@ def main():
         args.batch_size,
         not args.no_versioning,  # Enable versioning by default
         args.skip_media_check,
-        args.force_url_updates
+        args.force_url_updates,
+        args.skip_existing
     )
     end_time = time.time()
     elapsed_time = end_time - start_time
@@ -1009,6 +1202,8 @@ def main():
     if args.incremental:
         print(f"Skipped (from index): {stats.get('skipped_indexed', 0)}")
     print(f"Skipped (unchanged): {stats['skipped_unchanged']}")
+    if args.skip_existing:
+        print(f"Skipped (already in database): {stats['skipped_existing']}")
     if 'metadata_changes' in stats and stats['metadata_changes'] > 0:
         print(f"Metadata changes detected: {stats['metadata_changes']}")
     if 'url_updates' in stats and stats['url_updates'] > 0: